@@ -0,0 +1,115 @@
+# Rank matrix that only stores, for each agent, the window of agent ids spanned by its preference list. Used in place
+# of util.get_rank_matrix for k-range instances, where lists (and above all the reduced GS-lists) only span agents a
+# few k apart.
+
+import numpy as np
+from util import UNACCEPTABLE
+
+
+class RankRow(dict):
+    """
+    One row of a rank matrix as a dict, agent as key and rank as value. Agents that aren't on the list, and the partner
+    -1, are UNACCEPTABLE, like in a row of util.get_rank_matrix. Lookups of agents on the list cost a plain dict lookup.
+    """
+
+    def __missing__(self, agent):
+        return UNACCEPTABLE
+
+
+class BandedRankMatrix:
+    """
+    A rank matrix that stores each agent's row as a band: its ranks of the agents from the lowest numbered to the highest
+    numbered on its list, and the offset of the band. Bands are stored one after the other in a single array, so memory
+    is the total width of the windows: O(nk) for lists of a k-range instance with agents numbered along the master
+    list, instead of the O(n^2) of util.get_rank_matrix. Lookups are translated through the offset, and anything outside
+    the band is UNACCEPTABLE.
+
+    m[i, j] gives the same rank as util.get_rank_matrix(prefs, size)[i, j], including UNACCEPTABLE for j = -1, for one
+    pair or for arrays of rows and columns, and np.asarray(m) builds that dense matrix for code that needs more array
+    operations.
+
+    ...
+
+    Attributes
+    ----------
+    offsets : np.ndarray
+        offsets[i] is the lowest agent on i's list, whose rank is the first of i's band.
+    widths : np.ndarray
+        widths[i] is the width of i's band, 0 for an empty list.
+    starts : np.ndarray
+        starts[i] is the index in data where i's band begins.
+    data : np.ndarray
+        The bands, one after the other. Agents in a window but not on the list are UNACCEPTABLE.
+    shape : tuple
+        Shape of the equivalent dense rank matrix, with its trailing column.
+    Methods
+    -------
+    row(i):
+        Returns row i as a RankRow.
+    tolist():
+        Returns every row as a RankRow.
+    toarray():
+        Builds the equivalent dense rank matrix.
+    """
+
+    def __init__(self, prefs, size):
+        """
+        Parameters
+        ----------
+        prefs : list
+            List of individual preference lists. Each individual list is a list of lists, to account for indifference.
+        size : int
+            Number of agents that can appear on the lists, see util.get_list_size.
+        """
+        self.shape = (len(prefs), size + 1)
+        self.offsets = np.zeros(len(prefs), dtype=np.int64)
+        self.widths = np.zeros(len(prefs), dtype=np.int64)
+        for i, l in enumerate(prefs):
+            agents = [agent for tier in l for agent in tier]
+            if len(agents) > 0:
+                self.offsets[i] = min(agents)
+                self.widths[i] = max(agents) - self.offsets[i] + 1
+        self.starts = np.zeros(len(prefs) + 1, dtype=np.int64)
+        np.cumsum(self.widths, out=self.starts[1:])
+        self.data = np.full(self.starts[-1], UNACCEPTABLE, dtype=np.int32)
+        for i, l in enumerate(prefs):
+            for rank in range(len(l)):
+                self.data[self.starts[i] + np.asarray(l[rank], dtype=np.int64) - self.offsets[i]] = rank
+
+    def __getitem__(self, key):
+        i, j = key
+        if np.ndim(i) > 0 or np.ndim(j) > 0:
+            # arrays of rows and columns, broadcast together as NumPy would
+            i, j = np.broadcast_arrays(np.asarray(i, dtype=np.int64), np.asarray(j, dtype=np.int64))
+            j = j - self.offsets[i]
+            inside = (j >= 0) & (j < self.widths[i])
+            return np.where(inside, self.data[np.where(inside, self.starts[i] + j, 0)] if len(self.data) > 0 else 0,
+                            UNACCEPTABLE)
+        j -= self.offsets[i]
+        if j < 0 or j >= self.widths[i]:
+            return UNACCEPTABLE
+        return self.data[self.starts[i] + j]
+
+    def __array__(self, dtype=None, copy=None):
+        return self.toarray() if dtype is None else self.toarray().astype(dtype)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def row(self, i):
+        """Returns row i as a RankRow, with only the agents on i's list as keys."""
+        band = self.data[self.starts[i]:self.starts[i + 1]].tolist()
+        offset = int(self.offsets[i])
+        return RankRow((offset + j, rank) for j, rank in enumerate(band) if rank != UNACCEPTABLE)
+
+    def tolist(self):
+        """Returns the rows as RankRows. Like the nested lists of np.ndarray.tolist, rows are indexed by agent, but only
+        the agents on each list are stored."""
+        return [self.row(i) for i in range(self.shape[0])]
+
+    def toarray(self):
+        """Builds the equivalent dense rank matrix, as util.get_rank_matrix would."""
+        ranks = np.full(self.shape, UNACCEPTABLE, dtype=np.int64)
+        for i in range(self.shape[0]):
+            ranks[i, self.offsets[i]:self.offsets[i] + self.widths[i]] = self.data[self.starts[i]:self.starts[i + 1]]
+        return ranks
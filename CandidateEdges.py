@@ -0,0 +1,110 @@
+# Indexed store for E', the candidate edges of the rotation-finding algorithm that haven't been added to Gd yet.
+
+
+class CandidateEdges:
+    """
+    The edges of E', indexed by man and by woman and bucketed by rank. Edges are (man, woman) tuples of ints, ranks are
+    positions in the GS-lists. Iterating over the store visits the remaining edges in the order they were added.
+
+    Since edges are only ever removed, each agent keeps a pointer to its best (for men) or worst (for women) bucket that
+    may still be nonempty, so finding a man's best remaining edges is amortized O(1) and dropping edges from the ends
+    of a list costs time proportional to the number of edges dropped.
+
+    ...
+
+    Attributes
+    ----------
+    man_ranks : list
+        man_ranks[m][w] is m's rank of w.
+    woman_ranks : list
+        woman_ranks[w][m] is w's rank of m.
+    edges : dict
+        The remaining edges as keys, in the order they were added.
+    man_buckets : list
+        man_buckets[m][r] is a dict with m's remaining edges of rank r as keys.
+    woman_buckets : list
+        woman_buckets[w][r] is a dict with w's remaining edges of rank r as keys.
+    man_best : list
+        man_best[m] is the lowest rank that may still have edges of m.
+    woman_worst : list
+        woman_worst[w] is the highest rank that may still have edges of w.
+    Methods
+    -------
+    remove(edge):
+        Removes an edge.
+    best(man):
+        Returns the man's best ranked remaining edges.
+    drop_man_at_or_above(man, rank):
+        Removes every edge of the man he ranks at rank or better.
+    drop_woman_below(woman, rank):
+        Removes every edge of the woman she ranks worse than rank.
+    """
+
+    def __init__(self, edges, man_ranks, woman_ranks, man_list_sizes, woman_list_sizes):
+        """
+        Parameters
+        ----------
+        edges : iterable
+            The edges of E', as (man, woman) tuples.
+        man_ranks : list
+            man_ranks[m][w] is m's rank of w.
+        woman_ranks : list
+            woman_ranks[w][m] is w's rank of m.
+        man_list_sizes : list
+            Number of ranks in each man's list.
+        woman_list_sizes : list
+            Number of ranks in each woman's list.
+        """
+        self.man_ranks = man_ranks
+        self.woman_ranks = woman_ranks
+        self.edges = {}
+        self.man_buckets = [[{} for _ in range(size)] for size in man_list_sizes]
+        self.woman_buckets = [[{} for _ in range(size)] for size in woman_list_sizes]
+        self.man_best = [0] * len(man_list_sizes)
+        self.woman_worst = [size - 1 for size in woman_list_sizes]
+        for edge in edges:
+            man, woman = edge
+            self.edges[edge] = None
+            self.man_buckets[man][man_ranks[man][woman]][edge] = None
+            self.woman_buckets[woman][woman_ranks[woman][man]][edge] = None
+
+    def __iter__(self):
+        return iter(self.edges)
+
+    def __contains__(self, edge):
+        return edge in self.edges
+
+    def __len__(self):
+        return len(self.edges)
+
+    def remove(self, edge):
+        man, woman = edge
+        del self.edges[edge]
+        del self.man_buckets[man][self.man_ranks[man][woman]][edge]
+        del self.woman_buckets[woman][self.woman_ranks[woman][man]][edge]
+
+    def best(self, man):
+        """Returns a list of the man's remaining edges of his best remaining rank, in the order they were added. Empty if
+        he has none left."""
+        buckets = self.man_buckets[man]
+        while self.man_best[man] < len(buckets) and len(buckets[self.man_best[man]]) == 0:
+            self.man_best[man] += 1
+        if self.man_best[man] == len(buckets):
+            return []
+        return list(buckets[self.man_best[man]])
+
+    def drop_man_at_or_above(self, man, rank):
+        """Removes every remaining edge the man ranks at rank or better."""
+        buckets = self.man_buckets[man]
+        while self.man_best[man] <= rank and self.man_best[man] < len(buckets):
+            for edge in list(buckets[self.man_best[man]]):
+                self.remove(edge)
+            self.man_best[man] += 1
+
+    def drop_woman_below(self, woman, rank):
+        """Removes every remaining edge the woman ranks strictly worse than rank."""
+        buckets = self.woman_buckets[woman]
+        while self.woman_worst[woman] > rank:
+            for edge in list(buckets[self.woman_worst[woman]]):
+                self.remove(edge)
+            self.woman_worst[woman] -= 1
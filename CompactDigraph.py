@@ -0,0 +1,444 @@
+# Integer-indexed digraph over the men and women of an instance, used by the rotation-finding algorithm in place of
+# networkx graphs with 'm<i>'/'w<j>' string nodes.
+
+from GraphVisualization import Digraph
+
+
+class CompactDigraph:
+    """
+    A directed graph whose nodes are the men and women of an instance. Man m is node m, woman w is node num_men + w.
+    Nodes and successors are kept in insertion order, so iterating over the graph visits nodes and edges in the same
+    order a networkx DiGraph built by the same calls would.
+
+    ...
+
+    Attributes
+    ----------
+    num_men : int
+        Number of men in the instance. Women's nodes start at this offset.
+    succ : dict
+        Node as key, dict with the node's successors as keys as value.
+    pred : dict
+        Node as key, dict with the node's predecessors as keys as value.
+    position : dict
+        Node as key, the order in which the node was added as value.
+    Methods
+    -------
+    woman(w):
+        Returns the node of woman w.
+    addNodes(nodes):
+        Adds nodes to the graph.
+    addDirectedEdge(a, b):
+        Adds the edge a -> b.
+    removeDirectedEdge(a, b):
+        Removes the edge a -> b.
+    stronglyConnectedComponents():
+        Generates the strongly connected components of the graph.
+    toDigraph():
+        Builds the equivalent GraphVisualization.Digraph, for debugging.
+    """
+
+    def __init__(self, num_men):
+        self.num_men = num_men
+        self.succ = {}
+        self.pred = {}
+        self.position = {}
+
+    def __iter__(self):
+        return iter(self.succ)
+
+    def __contains__(self, node):
+        return node in self.succ
+
+    def __len__(self):
+        return len(self.succ)
+
+    def woman(self, w):
+        """Returns the node of woman w."""
+        return self.num_men + w
+
+    def isMan(self, node):
+        """Returns True if the node is a man."""
+        return node < self.num_men
+
+    def label(self, node):
+        """Returns the string label of a node, 'm<i>' for men and 'w<j>' for women."""
+        if self.isMan(node):
+            return 'm' + str(node)
+        return 'w' + str(node - self.num_men)
+
+    def addNodes(self, nodes):
+        for node in nodes:
+            if node not in self.succ:
+                self.position[node] = len(self.succ)
+                self.succ[node] = {}
+                self.pred[node] = {}
+
+    # a is origin, b destination
+    def addDirectedEdge(self, a, b):
+        self.addNodes((a, b))
+        self.succ[a][b] = None
+        self.pred[b][a] = None
+
+    def removeDirectedEdge(self, a, b):
+        del self.succ[a][b]
+        del self.pred[b][a]
+
+    def hasEdge(self, a, b):
+        return a in self.succ and b in self.succ[a]
+
+    def degree(self, node):
+        return len(self.succ[node]) + len(self.pred[node])
+
+    def edges(self):
+        """Generates the edges of the graph, ordered by origin node then by insertion."""
+        for a, successors in self.succ.items():
+            for b in successors:
+                yield a, b
+
+    def outDegreeOfComponent(self, component):
+        """ Gets the outdegree of a component in the graph.
+
+           Parameters
+           ----------
+           component: set
+               Nodes in the component being checked.
+
+           Returns
+           -------
+           int:
+                Outdegree of the component.
+           """
+        out_count = 0
+        for node in component:
+            for successor in self.succ[node]:
+                if successor not in component:
+                    out_count += 1
+        return out_count
+
+    def stronglyConnectedComponents(self):
+        """Generates the strongly connected components of the graph with Tarjan's algorithm. Nodes and successors are
+        visited in insertion order, so components come out in the same order as networkx's
+        strongly_connected_components.
+
+        Returns
+        -------
+        generator
+            Generator of sets of nodes, one per component.
+        """
+        lowlink = {}
+        found = set()
+        index = 0
+        for source in self.succ:
+            if source in lowlink:
+                continue
+            index += 1
+            lowlink[source] = index
+            dfs = [(source, iter(self.succ[source]))]
+            is_root = [True]
+            comp_stack = []
+            while dfs:
+                v, successors = dfs[-1]
+                for w in successors:
+                    if w not in lowlink:
+                        index += 1
+                        lowlink[w] = index
+                        dfs.append((w, iter(self.succ[w])))
+                        is_root.append(True)
+                        break
+                    if w not in found and lowlink[v] > lowlink[w]:
+                        is_root[-1] = False
+                        lowlink[v] = lowlink[w]
+                else:
+                    dfs.pop()
+                    if is_root.pop():
+                        v_low = lowlink[v]
+                        component = {v}
+                        while comp_stack and lowlink[comp_stack[-1]] >= v_low:
+                            component.add(comp_stack.pop())
+                        found.update(component)
+                        yield component
+                    else:
+                        comp_stack.append(v)
+                        parent = dfs[-1][0]
+                        if lowlink[parent] > lowlink[v]:
+                            is_root[-1] = False
+                            lowlink[parent] = lowlink[v]
+
+    def toDigraph(self):
+        """Builds the equivalent GraphVisualization.Digraph with 'm<i>'/'w<j>' string nodes. Only meant for debugging,
+        e.g. CompactDigraph.toDigraph().visualize().
+
+        Returns
+        -------
+        Digraph
+            Digraph with the same nodes and edges.
+        """
+        g = Digraph()
+        g.addNodes([self.label(node) for node in self.succ])
+        for a, b in self.edges():
+            g.addDirectedEdge(self.label(a), self.label(b))
+        return g
+
+
+class CondensedDigraph(CompactDigraph):
+    """
+    A CompactDigraph that keeps track of its strongly connected components, and which of them are sinks (have outdegree
+    0), as edges are added and removed. Adding an edge between two components merges every component on a cycle it
+    closes, removing an edge inside a component reruns Tarjan's algorithm on that component only. Reversing an edge is a
+    removal followed by an addition.
+
+    The components are kept in a topological order, as in Pearce and Kelly's algorithm. An edge that goes forward in it
+    can't close a cycle and is added in O(1). Otherwise only the components placed between its two ends are searched,
+    forwards from the head and backwards from the tail, which costs O(size of those components and their edges), plus
+    sorting them, and they are reordered (or merged) within the positions they held. Splitting a component puts its
+    parts in its place and renumbers the order, O(number of components) on top of Tarjan's algorithm on the component.
+
+    ...
+
+    Attributes
+    ----------
+    component : dict
+        Node as key, id of the component containing the node as value.
+    members : dict
+        Component id as key, set of the nodes in the component as value.
+    out_count : dict
+        Component id as key, number of edges from the component to other components as value.
+    sinks : set
+        Ids of the components with outdegree 0.
+    order : dict
+        Component id as key, its position in topo as value. Every edge between components goes to a later position.
+    topo : list
+        Component ids in topological order, with None where a component was merged away.
+    Methods
+    -------
+    inSinkComponent(node):
+        Checks whether the component containing a node has outdegree 0.
+    componentOf(node):
+        Returns the nodes in the component containing a node.
+    sinkComponents():
+        Returns the components with outdegree 0.
+    firstEntered(components):
+        Returns which of the given components stronglyConnectedComponents would generate first.
+    """
+
+    def __init__(self, num_men):
+        super().__init__(num_men)
+        self.component = {}
+        self.members = {}
+        self.out_count = {}
+        self.sinks = set()
+        self.next_id = 0
+        self.order = {}
+        self.topo = []
+
+    def addNodes(self, nodes):
+        for node in nodes:
+            if node not in self.succ:
+                super().addNodes((node,))
+                c = self.new_component({node})
+                self.order[c] = len(self.topo)
+                self.topo.append(c)
+
+    def addDirectedEdge(self, a, b):
+        if self.hasEdge(a, b):
+            return
+        super().addDirectedEdge(a, b)
+        ca = self.component[a]
+        cb = self.component[b]
+        if ca == cb:
+            return
+
+        if self.order[ca] < self.order[cb]:  # a path from b back to a would have to go backwards in the order
+            self.out_count[ca] += 1
+            self.sinks.discard(ca)
+            return
+
+        # components reachable from b's component and placed no later than a's, the only ones a path back to a uses
+        upper = self.order[ca]
+        reachable = {cb}
+        stack = [cb]
+        while stack:
+            c = stack.pop()
+            for node in self.members[c]:
+                for successor in self.succ[node]:
+                    cs = self.component[successor]
+                    if cs not in reachable and self.order[cs] <= upper:
+                        reachable.add(cs)
+                        stack.append(cs)
+
+        # components that reach a's component and are placed no earlier than b's
+        lower = self.order[cb]
+        reaching = {ca}
+        stack = [ca]
+        while stack:
+            c = stack.pop()
+            for node in self.members[c]:
+                for predecessor in self.pred[node]:
+                    cp = self.component[predecessor]
+                    if cp not in reaching and self.order[cp] >= lower:
+                        reaching.add(cp)
+                        stack.append(cp)
+
+        # the components reaching a go first and those reachable from b last, in the positions they all held. If the
+        # new edge closes a cycle, every component on a path from b back to a is in both and they're merged in between
+        positions = sorted(self.order[c] for c in reachable | reaching)
+        merged = reachable & reaching
+        before = sorted(reaching - merged, key=self.order.__getitem__)
+        after = sorted(reachable - merged, key=self.order.__getitem__)
+        for position in positions:
+            self.topo[position] = None
+        if len(merged) > 0:
+            nodes = set()
+            for c in merged:
+                del self.order[c]
+                nodes.update(self.delete_component(c))
+            before.append(self.new_component(nodes))
+        else:
+            self.out_count[ca] += 1
+            self.sinks.discard(ca)
+        for c, position in zip(before, positions):
+            self.order[c] = position
+            self.topo[position] = c
+        for c, position in zip(after, positions[len(positions) - len(after):]):
+            self.order[c] = position
+            self.topo[position] = c
+
+    def removeDirectedEdge(self, a, b):
+        super().removeDirectedEdge(a, b)
+        ca = self.component[a]
+        if ca != self.component[b]:
+            self.out_count[ca] -= 1
+            if self.out_count[ca] == 0:
+                self.sinks.add(ca)
+            return
+
+        # the edge was inside a component, which may have split
+        nodes = self.members[ca]
+        parts = list(self.components_within(nodes))
+        if len(parts) == 1:
+            return
+        self.delete_component(ca)
+        # Tarjan's algorithm finds the parts in reverse topological order, they take the component's place in the order
+        position = self.order.pop(ca)
+        self.topo[position:position + 1] = [self.new_component(part) for part in parts][::-1]
+        self.topo = [c for c in self.topo if c is not None]
+        for i, c in enumerate(self.topo):
+            self.order[c] = i
+
+    def new_component(self, nodes):
+        """Registers a set of nodes as a component and counts its outgoing edges."""
+        c = self.next_id
+        self.next_id += 1
+        self.members[c] = nodes
+        for node in nodes:
+            self.component[node] = c
+        out_count = 0
+        for node in nodes:
+            for successor in self.succ[node]:
+                if successor not in nodes:
+                    out_count += 1
+        self.out_count[c] = out_count
+        if out_count == 0:
+            self.sinks.add(c)
+        return c
+
+    def delete_component(self, c):
+        """Forgets a component, returning its nodes."""
+        self.sinks.discard(c)
+        del self.out_count[c]
+        return self.members.pop(c)
+
+    def components_within(self, nodes):
+        """Generates the strongly connected components of the subgraph induced by nodes, with Tarjan's algorithm."""
+        lowlink = {}
+        found = set()
+        index = 0
+        for source in nodes:
+            if source in lowlink:
+                continue
+            index += 1
+            lowlink[source] = index
+            dfs = [(source, iter(self.succ[source]))]
+            is_root = [True]
+            comp_stack = []
+            while dfs:
+                v, successors = dfs[-1]
+                for w in successors:
+                    if w not in nodes:
+                        continue
+                    if w not in lowlink:
+                        index += 1
+                        lowlink[w] = index
+                        dfs.append((w, iter(self.succ[w])))
+                        is_root.append(True)
+                        break
+                    if w not in found and lowlink[v] > lowlink[w]:
+                        is_root[-1] = False
+                        lowlink[v] = lowlink[w]
+                else:
+                    dfs.pop()
+                    if is_root.pop():
+                        v_low = lowlink[v]
+                        component = {v}
+                        while comp_stack and lowlink[comp_stack[-1]] >= v_low:
+                            component.add(comp_stack.pop())
+                        found.update(component)
+                        yield component
+                    else:
+                        comp_stack.append(v)
+                        parent = dfs[-1][0]
+                        if lowlink[parent] > lowlink[v]:
+                            is_root[-1] = False
+                            lowlink[parent] = lowlink[v]
+
+    def inSinkComponent(self, node):
+        """Checks whether the component containing node has outdegree 0. False if the node isn't in the graph."""
+        return node in self.component and self.component[node] in self.sinks
+
+    def componentOf(self, node):
+        """Returns the set of nodes in the component containing node."""
+        return self.members[self.component[node]]
+
+    def sinkComponents(self):
+        """Returns the components with outdegree 0, as sets of nodes, in no particular order."""
+        return [self.members[c] for c in self.sinks]
+
+    def firstEntered(self, components):
+        """Finds which of the given sink components stronglyConnectedComponents would generate first. Since a sink
+        component is generated as soon as the depth first search has gone through it, that is the first one the search
+        enters, so the search stops there instead of going through the whole graph.
+
+        Parameters
+        ----------
+        components : list
+            Sink components, as sets of nodes.
+
+        Returns
+        -------
+        int
+            Index in components of the first one generated.
+        """
+        index_of = {}
+        for i in range(len(components)):
+            for node in components[i]:
+                index_of[node] = i
+        visited = set()
+        for source in self.succ:
+            if source in visited:
+                continue
+            if source in index_of:
+                return index_of[source]
+            visited.add(source)
+            dfs = [iter(self.succ[source])]
+            while dfs:
+                for w in dfs[-1]:
+                    if w not in visited:
+                        if w in index_of:
+                            return index_of[w]
+                        visited.add(w)
+                        dfs.append(iter(self.succ[w]))
+                        break
+                else:
+                    dfs.pop()
+        return None
@@ -0,0 +1,163 @@
+# Compressed sparse row (CSR) storage of preference lists, and the rank matrix built on it, for instances with short
+# (incomplete) lists, where dense n by n structures would mostly hold unacceptable pairs.
+
+import numpy as np
+from util import UNACCEPTABLE
+from BandedRankMatrix import RankRow
+
+
+class SparsePreferences:
+    """
+    Preference lists of one side in compressed sparse row form. The lists are concatenated into one array of agent ids,
+    tier_ptr marks where each tier starts in it and list_ptr where each agent's tiers start in tier_ptr, so memory is
+    proportional to the number of acceptable pairs.
+
+    Behaves like the usual list of lists of tiers: len(prefs) is the number of agents and prefs[i] builds agent i's list
+    of tiers, so it can be passed anywhere preference lists are expected.
+
+    ...
+
+    Attributes
+    ----------
+    agents : np.ndarray
+        The agents on every list, list after list and tier after tier.
+    tier_ptr : np.ndarray
+        tier_ptr[t] is the index in agents where tier t starts, with a final entry for the end of the last tier.
+    list_ptr : np.ndarray
+        The tiers of agent i are tiers list_ptr[i] to list_ptr[i + 1] - 1.
+    Methods
+    -------
+    list_length(i):
+        Returns the number of agents on i's list.
+    pairs():
+        Returns every (agent, agent on its list) pair as two arrays.
+    tolist():
+        Builds the preference lists as a list of lists of tiers.
+    """
+
+    def __init__(self, prefs):
+        """
+        Parameters
+        ----------
+        prefs : list
+            List of individual preference lists. Each individual list is a list of lists, to account for indifference.
+        """
+        agents = []
+        tier_ptr = [0]
+        list_ptr = [0]
+        for l in prefs:
+            for tier in l:
+                agents.extend(tier)
+                tier_ptr.append(len(agents))
+            list_ptr.append(len(tier_ptr) - 1)
+        self.agents = np.array(agents, dtype=np.int32)
+        self.tier_ptr = np.array(tier_ptr, dtype=np.int64)
+        self.list_ptr = np.array(list_ptr, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.list_ptr) - 1
+
+    def __getitem__(self, i):
+        bounds = self.tier_ptr[self.list_ptr[i]:self.list_ptr[i + 1] + 1].tolist()
+        return [self.agents[start:end].tolist() for start, end in zip(bounds, bounds[1:])]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def list_length(self, i):
+        """Returns the number of agents on i's list."""
+        return int(self.tier_ptr[self.list_ptr[i + 1]] - self.tier_ptr[self.list_ptr[i]])
+
+    def pairs(self):
+        """Returns two parallel arrays, the owner of each list entry and the agent in it, in list order."""
+        lengths = np.diff(self.tier_ptr[self.list_ptr])
+        return np.repeat(np.arange(len(self), dtype=np.int64), lengths), self.agents.astype(np.int64)
+
+    def tolist(self):
+        """Builds the preference lists as a list of lists of tiers."""
+        return list(self)
+
+
+class SparseRankMatrix:
+    """
+    A rank matrix of preference lists that only stores the acceptable pairs. The reverse index is one sorted array of
+    pair codes, row * (size + 1) + agent, with the ranks in the same order, so a lookup is a binary search and memory is
+    proportional to the number of acceptable pairs. Agents that aren't on a list, and the partner -1, are UNACCEPTABLE.
+
+    Indexed like util.get_rank_matrix: m[i, j] for one pair, or m[rows, cols] with arrays of rows and columns, which
+    are broadcast together as NumPy would. np.asarray(m) builds the dense matrix.
+
+    ...
+
+    Attributes
+    ----------
+    codes : np.ndarray
+        Sorted codes of the acceptable pairs.
+    ranks : np.ndarray
+        ranks[p] is the rank of the pair with code codes[p].
+    row_ptr : np.ndarray
+        The pairs of row i are codes row_ptr[i] to row_ptr[i + 1] - 1.
+    shape : tuple
+        Shape of the equivalent dense rank matrix, with its trailing column.
+    Methods
+    -------
+    row(i):
+        Returns row i as a RankRow.
+    tolist():
+        Returns every row as a RankRow.
+    toarray():
+        Builds the equivalent dense rank matrix.
+    """
+
+    def __init__(self, prefs, size):
+        """
+        Parameters
+        ----------
+        prefs : list or SparsePreferences
+            List of individual preference lists. Each individual list is a list of lists, to account for indifference.
+        size : int
+            Number of agents that can appear on the lists, see util.get_list_size.
+        """
+        if not isinstance(prefs, SparsePreferences):
+            prefs = SparsePreferences(prefs)
+        self.shape = (len(prefs), size + 1)
+        rows, agents = prefs.pairs()
+        tier_lengths = np.diff(prefs.tier_ptr)
+        tier_ranks = np.arange(len(tier_lengths), dtype=np.int64) - np.repeat(prefs.list_ptr[:-1], np.diff(prefs.list_ptr))
+        codes = rows * self.shape[1] + agents
+        order = np.argsort(codes, kind='stable')
+        self.codes = codes[order]
+        self.ranks = np.repeat(tier_ranks, tier_lengths).astype(np.int32)[order]
+        self.row_ptr = np.searchsorted(self.codes, np.arange(self.shape[0] + 1, dtype=np.int64) * self.shape[1])
+
+    def __getitem__(self, key):
+        i, j = key
+        codes = np.asarray(i, dtype=np.int64) * self.shape[1] + np.asarray(j, dtype=np.int64)
+        if len(self.codes) == 0:
+            return np.full(codes.shape, UNACCEPTABLE, dtype=np.int64)[()]
+        positions = np.minimum(np.searchsorted(self.codes, codes), len(self.codes) - 1)
+        return np.where(self.codes[positions] == codes, self.ranks[positions], UNACCEPTABLE)[()]
+
+    def __array__(self, dtype=None, copy=None):
+        return self.toarray() if dtype is None else self.toarray().astype(dtype)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def row(self, i):
+        """Returns row i as a RankRow, with only the agents on i's list as keys."""
+        start, end = self.row_ptr[i], self.row_ptr[i + 1]
+        agents = (self.codes[start:end] - i * self.shape[1]).tolist()
+        return RankRow(zip(agents, self.ranks[start:end].tolist()))
+
+    def tolist(self):
+        """Returns the rows as RankRows. Like the nested lists of np.ndarray.tolist, rows are indexed by agent, but only
+        the agents on each list are stored."""
+        return [self.row(i) for i in range(self.shape[0])]
+
+    def toarray(self):
+        """Builds the equivalent dense rank matrix, as util.get_rank_matrix would."""
+        ranks = np.full(self.shape, UNACCEPTABLE, dtype=np.int64)
+        ranks.flat[self.codes] = self.ranks
+        return ranks
@@ -1,9 +1,16 @@
-import random
 import tests
+import heapq
+import random
+import statistics
 import numpy as np
 from copy import deepcopy
-from collections import Counter
-from GraphVisualization import Digraph
+from collections import deque
+from itertools import chain
+from multiprocessing import Pool
+from CompactDigraph import CompactDigraph, CondensedDigraph
+from CandidateEdges import CandidateEdges
+from BandedRankMatrix import BandedRankMatrix
+from SparsePreferences import SparsePreferences, SparseRankMatrix
 import util
 import networkx as nx
 
@@ -36,14 +43,134 @@ def test_example(prefs, rotations_expected, rotation_digraph_expected):
         assert instance.is_weakly_stable(matching), matching
         assert instance.is_strongly_stable(matching), matching
         assert instance.is_super_stable(matching), matching
+    assert instance.verify_matchings(instance.matchings, 'super').all()
 
     assert len(instance.matchings) == instance.count_matchings()
+    estimate, (low, high) = instance.estimate_matching_count(2000, seed=0)
+    assert low <= instance.count_matchings() <= high
+    for antichain, rotations, matching in instance.sample_matchings(5, seed=0):
+        assert matching in instance.matchings
+        assert instance.get_required_rotations(antichain) == rotations
+    for antichain, rotations, matching in instance.sample_matchings(5, seed=0, max_states=0):
+        assert matching in instance.matchings
+    antichains = list(instance.iter_antichains())
+    assert len(antichains) == len(instance.matchings)
+    assert [list(m) for m in instance.iter_matchings(reuse_buffer=True)] == instance.matchings
     assert instance.rotations == rotations_expected
     assert rotation_digraph_expected == rotation_digraph
+
+    # an instance built from the rank matrices must have the same rotations
+    from_ranks = SuperStableMatchingInstance.from_rank_matrices(instance.man_rank, instance.woman_rank)
+    from_ranks.set_all_rotations()
+    assert from_ranks.rotations == rotations_expected
+
+    # round-synchronous proposals must give the same GS-lists
+    by_rounds = SuperStableMatchingInstance(male_prefs, female_prefs, rounds=True)
+    assert by_rounds.male_prefs_GSlist == instance.male_prefs_GSlist
+    assert by_rounds.female_prefs_GSlist == instance.female_prefs_GSlist
+    assert getattr(by_rounds, 'man_optimal_SM', None) == getattr(instance, 'man_optimal_SM', None)
+    assert getattr(by_rounds, 'woman_optimal_SM', None) == getattr(instance, 'woman_optimal_SM', None)
     instance.create_rotation_digraph()
+    if len(antichains) > 0:
+        assert sorted(antichains) == sorted(sorted(a) for a in nx.algorithms.dag.antichains(instance.rotation_digraph))
+        assert instance.get_hasse_edges() == sorted(nx.transitive_reduction(instance.rotation_digraph).edges)
+        matchings, _, hasse_edges = run_example(male_prefs, female_prefs, reduced=True)
+        assert sorted(hasse_edges) == instance.get_hasse_edges()
+        assert sorted(matchings) == sorted(instance.matchings)
+        metrics = instance.rotation_poset_metrics()
+        assert metrics['width'] == max(len(a) for a in antichains)
+        assert metrics['height'] == len(nx.dag_longest_path(instance.rotation_digraph))
+        assert metrics['pathwidth'] == metrics['pathwidth_lower_bound']
+
+    # pair queries must match the pairs of the enumerated matchings
+    pairs = set((man, woman) for m in instance.matchings for man, woman in enumerate(m) if woman != -1)
+    assert instance.stable_pairs() == sorted(pairs)
+    assert instance.fixed_pairs() == sorted(p for p in pairs if all(m[p[0]] == p[1] for m in instance.matchings))
+    assert not any(instance.is_super_stable_pair(man, woman) for man in range(len(male_prefs))
+                   for woman in range(instance.num_women) if (man, woman) not in pairs)
+    for man, woman in pairs:
+        assert instance.is_super_stable_pair(man, woman)
+        with_pair = [m for m in instance.matchings if m[man] == woman]
+        assert instance.count_matchings(forced_pairs=[(man, woman)]) == len(with_pair)
+        assert instance.count_matchings(forced_pairs=(pair for pair in [(man, woman)])) == len(with_pair)
+        assert sorted(instance.iter_matchings(forced_pairs=[(man, woman)])) == sorted(with_pair)
+        without_pair = [m for m in instance.matchings if m[man] != woman]
+        assert instance.count_matchings(forbidden_pairs=[(man, woman)]) == len(without_pair)
+        assert sorted(instance.iter_matchings(forbidden_pairs=[(man, woman)])) == sorted(without_pair)
+
+    # optimal matchings must match a scan over every matching
+    if len(instance.matchings) > 0:
+        def egalitarian_cost(m):
+            return sum(instance.man_rank[man, woman] + instance.woman_rank[woman, man] for man, woman in enumerate(m) if woman != -1)
+        def regret(m):
+            return max([max(instance.man_rank[man, woman], instance.woman_rank[woman, man]) for man, woman in enumerate(m) if woman != -1], default=0)
+        matching, cost = instance.optimal_matching('egalitarian')
+        assert matching in instance.matchings and cost == min(egalitarian_cost(m) for m in instance.matchings)
+        top = list(instance.top_k_matchings(len(instance.matchings) + 1))
+        assert sorted(m for m, _ in top) == sorted(instance.matchings)
+        assert [c for _, c in top] == sorted(egalitarian_cost(m) for m in instance.matchings)
+        matching, cost = instance.optimal_matching('minimum-regret')
+        assert matching in instance.matchings and cost == regret(matching) == min(regret(m) for m in instance.matchings)
+    unmatched = SuperStableMatchingInstance([[] for _ in male_prefs], [[] for _ in male_prefs])
+    unmatched.set_all_rotations()
+    assert unmatched.optimal_matching('minimum-regret') == ([-1] * len(male_prefs), 0)
+    assert unmatched.optimal_matching('minimum-regret') == unmatched.optimal_matching('egalitarian')
+    assert has_super_stable_matching(male_prefs, female_prefs) == hasattr(instance, 'man_optimal_SM')
+    try:
+        instance.optimal_matching('egalitarain')
+        assert False, 'a misspelled objective must be rejected'
+    except ValueError:
+        pass
+
+    # solving the blocks separately must give the same rotations
+    by_blocks = SuperStableMatchingInstance(male_prefs, female_prefs)
+    by_blocks.set_all_rotations(decompose=True)
+    assert sorted(by_blocks.rotations) == sorted(instance.rotations)
+    assert by_blocks.count_matchings() == instance.count_matchings()
+    kernelized = SuperStableMatchingInstance(male_prefs, female_prefs)
+    kernelized.set_all_rotations(kernelize=True)
+    assert sorted(kernelized.rotations) == sorted(instance.rotations)
+
+    # banded rank matrices must give the same ranks and rotations
+    banded = SuperStableMatchingInstance(male_prefs, female_prefs, banded=True)
+    assert np.array_equal(np.asarray(banded.man_rank), instance.man_rank)
+    assert np.array_equal(np.asarray(banded.woman_rank), instance.woman_rank)
+    if hasattr(instance, 'man_optimal_SM'):
+        assert np.array_equal(np.asarray(banded.man_GSlist_rank), instance.man_GSlist_rank)
+        assert np.array_equal(np.asarray(banded.woman_GSlist_rank), instance.woman_GSlist_rank)
+    banded.set_all_rotations()
+    assert banded.rotations == instance.rotations
+    assert banded.verify_matchings(instance.matchings, 'super').all()
+
+    # so must CSR preferences and sparse rank matrices, and the stability checks over acceptable pairs
+    sparse = SuperStableMatchingInstance(male_prefs, female_prefs, sparse=True)
+    assert sparse.male_prefs.tolist() == male_prefs and sparse.female_prefs.tolist() == female_prefs
+    assert np.array_equal(np.asarray(sparse.man_rank), instance.man_rank)
+    assert np.array_equal(np.asarray(sparse.woman_rank), instance.woman_rank)
+    sparse.set_all_rotations()
+    assert sparse.rotations == instance.rotations
+    sparse_by_rounds = SuperStableMatchingInstance(male_prefs, female_prefs, rounds=True, sparse=True)
+    assert sparse_by_rounds.male_prefs_GSlist == instance.male_prefs_GSlist
+    assert sparse_by_rounds.female_prefs_GSlist == instance.female_prefs_GSlist
+    extremes = [getattr(instance, 'man_optimal_SM', [-1] * len(male_prefs)), [-1] * len(male_prefs)]
+    for stability in ('super', 'strong', 'weak'):
+        assert (sparse.verify_matchings(extremes, stability, report=True)[1] ==
+                instance.verify_matchings(extremes, stability, report=True)[1])
+    for matching, statuses in zip(extremes, instance.get_blocking_statuses(extremes)):
+        matching_inv = instance.get_partners(matching)
+        for man in range(len(male_prefs)):
+            for woman in range(instance.num_women):
+                if matching[man] != woman and instance.man_rank[man, woman] != -1 and instance.woman_rank[woman, man] != -1:
+                    assert instance.blocking_status(matching, man, woman, matching_inv) == statuses[man, woman]
+    if not instance.has_ties():
+        general = SuperStableMatchingInstance(male_prefs, female_prefs)
+        general.set_all_rotations(fast_path=False)
+        assert general.rotations == instance.rotations
+        assert general.cycle_starts == instance.cycle_starts
+        assert general.get_rotation_digraph_edges(general.rotations) == rotation_digraph
     print(instance.count_matchings())
 
-def run_example(male_prefs, female_prefs):
+def run_example(male_prefs, female_prefs, reduced=False):
     """Takes in preferences and returns the results of the algorithms: the matchings, rotations, and rotation digraph.
 
     Parameters
@@ -52,6 +179,8 @@ def run_example(male_prefs, female_prefs):
         A list of individual male prefs for the instance.
     female_prefs: list
         A list of individual female prefs for the instance.
+    reduced: bool
+        If True, only return the edges of the Hasse diagram of the rotation poset.
     Returns
     -------
     list:
@@ -64,10 +193,75 @@ def run_example(male_prefs, female_prefs):
     """
     instance = SuperStableMatchingInstance(male_prefs, female_prefs)
     instance.set_all_rotations()
+    instance.create_rotation_digraph(reduced)
     instance.set_all_matchings()
-    instance.create_rotation_digraph()
     return instance.matchings, instance.rotations, list(instance.rotation_digraph.edges)
 
+def has_super_stable_matching(male_prefs, female_prefs):
+    """Checks whether an instance has a super stable matching, without finding the rotations or the matchings.
+    Only runs the man-proposing SUPER pass, since it fails exactly when no super stable matching exists. Useful to
+    screen pairs of preferences before running run_example on them.
+
+    Parameters
+    ----------
+    male_prefs: list
+        A list of individual male prefs for the instance.
+    female_prefs: list
+        A list of individual female prefs for the instance.
+    Returns
+    -------
+    bool:
+        True if the instance has a super stable matching.
+    """
+    return SuperStableMatchingInstance.get_gendered_GS_list_incomplete_prefs(male_prefs, female_prefs)[0] is not None
+
+def run_example_streaming(male_prefs, female_prefs, reduced=False):
+    """Like run_example, but the matchings are generated one at a time instead of returned as a list, so they never
+    all have to be in memory.
+
+    Parameters
+    ----------
+    male_prefs: list
+        A list of individual male prefs for the instance.
+    female_prefs: list
+        A list of individual female prefs for the instance.
+    reduced: bool
+        If True, only return the edges of the Hasse diagram of the rotation poset.
+    Returns
+    -------
+    generator:
+        Generator of the super stable matchings in the instance.
+    list:
+        The rotations in the instance.
+    list:
+        The edges of the rotation poset in the instance.
+
+    """
+    instance = SuperStableMatchingInstance(male_prefs, female_prefs)
+    instance.set_all_rotations()
+    instance.create_rotation_digraph(reduced)
+    return instance.iter_matchings(), instance.rotations, list(instance.rotation_digraph.edges)
+
+def get_block_rotations(block, fast_path=True):
+    """Finds the rotations of a block of an instance (see SuperStableMatchingInstance.get_sub_instance). Defined at
+    module level so that blocks can be solved by a multiprocessing Pool.
+
+    Parameters
+    ----------
+    block: SuperStableMatchingInstance
+        The instance of the block.
+    fast_path: bool
+        Passed on to set_all_rotations.
+    Returns
+    -------
+    list:
+        The rotations of the block, in its own labels.
+    list:
+        The cycle starts of the rotations.
+    """
+    block.set_all_rotations(fast_path=fast_path)
+    return block.rotations, block.cycle_starts
+
 class SuperStableMatchingInstance:
     """
     A class used to represent a single SMTI instance, with super stable matchings in mind.
@@ -84,10 +278,12 @@ class SuperStableMatchingInstance:
          Set by set_all_rotations
     cycle_starts : list
         A list parallel to rotations that tracks the indices in the rotation where a cycle starts, since rotations can have multiple cycles.
-    female_prefs : list
+    female_prefs : list or SparsePreferences
         List of individual preference lists. Each individual list is also a list of lists, to account for indifference.
-    male_prefs : list
+        SparsePreferences if the instance is sparse.
+    male_prefs : list or SparsePreferences
         List of individual preference lists. Each individual list is also a list of lists, to account for indifference.
+        SparsePreferences if the instance is sparse.
     female_prefs_GSlist : list
         The reduced GS-list for the female preferences.
     male_prefs_GSlist : list
@@ -97,29 +293,121 @@ class SuperStableMatchingInstance:
     rotation_digraph_edges : list
         List of the edges in the rotation digraph. Each edge is a triplet in the form of (from_node, to_node, type)
         where type is 1 or 2, as described in Gusfield and Irving.
+    man_rank : np.ndarray, BandedRankMatrix or SparseRankMatrix
+        Rank matrix of the male prefs. man_rank[m, w] is the index of the tier w is in on m's list, or -1 if w is not
+        on the list. Has a trailing column of -1 so that man_rank[m, -1] (m unmatched) is -1. See util.get_rank_matrix.
+        A BandedRankMatrix if the instance is banded, a SparseRankMatrix if it is sparse.
+    woman_rank : np.ndarray, BandedRankMatrix or SparseRankMatrix
+        Rank matrix of the female prefs, woman_rank[w, m] is w's rank of m.
+    man_GSlist_rank : np.ndarray, BandedRankMatrix or SparseRankMatrix
+        Rank matrix of the male reduced GS-lists. Set by set_extreme_SMs
+    woman_GSlist_rank : np.ndarray, BandedRankMatrix or SparseRankMatrix
+        Rank matrix of the female reduced GS-lists. Set by set_extreme_SMs
+    stable_pair_set : set
+        The pairs in some super stable matching, for the rotations in stable_pair_rotations. Set by get_stable_pair_set
+    banded : bool
+        Whether the rank matrices are stored as BandedRankMatrix, for k-range instances.
+    sparse : bool
+        Whether the preferences are stored as SparsePreferences and the rank matrices as SparseRankMatrix, for
+        instances with short lists.
+    blocks : list
+        The independent blocks of the instance, as (men, women) pairs of sorted lists. Set by set_extreme_SMs, see
+        get_blocks
     Methods
     -------
-    count_matchings(self):
+    from_rank_matrices(man_rank, woman_rank, rounds, banded, sparse):
+        Creates an instance from rank matrices instead of preference lists.
+    count_matchings(forced_pairs, forbidden_pairs):
         Counts the super stable matchings in the instance.
+    estimate_matching_count(samples, seed, confidence):
+        Estimates the number of super stable matchings by sampling.
+    sample_matchings(count, seed, max_states, steps):
+        Draws super stable matchings uniformly at random.
+    stable_pairs():
+        Gets the pairs in some super stable matching.
+    get_stable_pair_set():
+        Gets the set of the pairs in some super stable matching, built once.
+    fixed_pairs():
+        Gets the pairs in every super stable matching.
+    is_super_stable_pair(man, woman):
+        Checks whether a pair is in some super stable matching.
+    get_pair_rotations():
+        Gets the rotations creating and removing each pair.
+    get_constraint_cases(forced_pairs, forbidden_pairs):
+        Translates pair constraints into constraints on the rotations.
+    optimal_matching(objective):
+        Finds an egalitarian, minimum-regret, sex-equal or minimum weight super stable matching.
+    get_pair_weight(objective):
+        Gets the weight function of a cost that is a sum over the pairs of a matching.
+    get_rotation_profits(weight):
+        Gets how much eliminating each rotation lowers the weight of a matching.
+    top_k_matchings(k, weight):
+        Generates the k super stable matchings of lowest weight.
+    get_minimum_regret_matching():
+        Finds a minimum regret super stable matching.
+    get_sex_equal_matching():
+        Finds a sex-equal super stable matching.
+    get_matching(ideal):
+        Gets the matching given by a closed set of rotations.
     eliminate_rotation(og_matching, rotation):
         Eliminates a rotation from a matching
     get_all_predecessor(graph, node):
         Gets all predecessors of a node in the rotation digraph
     set_all_matchings():
         Sets all matchings in an instance. Needs rotation digraph to be created
-    create_rotation_digraph():
+    get_rotation_changes(rotation, cycle_indices):
+        Gets the changes eliminating a rotation makes to a matching.
+    iter_matchings(reuse_buffer, forced_pairs, forbidden_pairs):
+        Generates the super stable matchings one at a time.
+    iter_antichains():
+        Generates the antichains of the rotation poset one at a time.
+    walk_ideals(required, forbidden):
+        Walks the ideals of the rotation poset, eliminating or undoing one rotation at a time on a single matching.
+    create_rotation_digraph(reduced):
         Creates and sets rotation digraph from rotatons
-    set_extreme_SMs():
+    get_hasse_edges():
+        Gets the edges of the Hasse diagram of the rotation poset.
+    set_rotation_closure_index():
+        Sets the ancestor and descendant bitsets of every rotation.
+    rotation_poset_metrics(time_budget):
+        Gets the height, width and pathwidth of the rotation poset.
+    get_closure_bits(rotations):
+        Gets the bitset of the rotations needed to eliminate the given ones.
+    get_required_rotations(antichain):
+        Gets the rotations required to reach the matching of an antichain.
+    are_comparable(rotation1, rotation2):
+        Checks whether two rotations are comparable.
+    get_maximal_rotations(rotations):
+        Gets the antichain of a closed set of rotations.
+    get_rank_matrix(prefs, size):
+        Builds a dense, banded or sparse rank matrix.
+    set_extreme_SMs(rounds):
         Sets the man and woman optimal stable matchings, as well as the reduced GS-lists.
     get_gendered_GS_list_incomplete_prefs(proposer_prefs_orig, proposee_prefs_orig):
         Gets the gendered GS list by running the extended Gale-Shapely algorithm.
+    get_gendered_GS_list_by_rounds(proposer_prefs_orig, proposee_prefs_orig, proposer_rank, proposee_rank):
+        Gets the gendered GS list with round-synchronous proposals.
     make_Gd(edges, M):
         Creates Gd, a graph used in the algorithm in set_all_rotations.
-    set_all_rotations():
+    set_all_rotations(decompose, processes, kernelize, fast_path):
         Finds all rotations in the instance.
+    has_ties():
+        Checks whether any preference list has a tie.
+    set_all_rotations_strict():
+        Finds all rotations of an instance without ties with the algorithm of Gusfield and Irving.
+    get_blocks():
+        Gets the connected components of the bipartite graph of the GS-lists.
+    get_kernel():
+        Gets the men and women whose partner differs between super stable matchings.
+    get_sub_instance(men, women):
+        Creates the instance restricted to some men and women, relabelled from 0.
+    get_original_rotation(rotation, cycle_indices, men, women):
+        Maps a rotation of a restricted instance back to the labels of the instance.
+    get_canonical_rotation(cycles):
+        Puts a rotation in the form all the methods list it in.
     eliminate_rotation_by_graph(rotation_subgraph, M):
         Eliminates a rotation from the graph of men and women.
-    remove_dominated_nonblocking_edges(M, E_prime):
+    remove_dominated_nonblocking_edges(M, M_inv, E_prime):
         Removes from E' edges that can be removed in the set_all_rotations algorithm.
     delete_multiple_engagement_edges(E_prime, Gc, Ec, Gd, edge_ranks):
         Deletes edges to multiply engaged women in the set_all_rotations algorithm.
@@ -131,22 +419,89 @@ class SuperStableMatchingInstance:
         Checks if the matching is strongly stable.
     is_weakly_stable(matching):
         Checks if the matching is weakly stable.
-    blocking_status(matching, man, woman):
+    verify_matchings(matchings, stability, report, chunk_size):
+        Checks a set of matchings for stability at once.
+    get_blocking_statuses(matchings):
+        Returns the blocking status of every pair in every matching.
+    get_acceptable_pair_statuses(matchings):
+        Returns the blocking status of every acceptable pair in every matching.
+    get_opinions(partner_rank, pair_rank):
+        Compares agents' partners to the pairs they are in, for the blocking statuses.
+    blocking_status(matching, man, woman, matching_inv):
         Returns the extent to which the man and woman block the matching.
 
 
     """
-    def __init__(self, male_prefs, female_prefs):
+    def __init__(self, male_prefs, female_prefs, rounds=False, banded=False, sparse=False):
         self.matchings = []
         self.rotations = []
         self.female_prefs_GSlist = []
         self.male_prefs_GSlist = []
+        self.num_women = util.get_list_size(male_prefs, len(female_prefs))
+        self.num_men = util.get_list_size(female_prefs, len(male_prefs))
+        if sparse:
+            male_prefs = SparsePreferences(male_prefs)
+            female_prefs = SparsePreferences(female_prefs)
         self.male_prefs = male_prefs
         self.female_prefs = female_prefs
-        self.set_extreme_SMs()
+        self.banded = banded
+        self.sparse = sparse
+        self.man_rank = self.get_rank_matrix(male_prefs, self.num_women)
+        self.woman_rank = self.get_rank_matrix(female_prefs, self.num_men)
+        self.set_extreme_SMs(rounds)
         self.rotation_digraph_edges = []
         self.cycle_starts = []
 
+    @classmethod
+    def from_rank_matrices(cls, man_rank, woman_rank, rounds=False, banded=False, sparse=False):
+        """Creates an instance from rank matrices instead of preference lists.
+
+        Parameters
+        ----------
+        man_rank : np.ndarray
+            2d array where man_rank[m, w] is man m's rank of woman w. Equal ranks are ties, negative ranks are unacceptable.
+        woman_rank : np.ndarray
+            2d array where woman_rank[w, m] is woman w's rank of man m.
+        rounds : bool
+            If True, the extreme matchings are found with round-synchronous proposals. See set_extreme_SMs.
+        banded : bool
+            If True, the instance stores its rank matrices as BandedRankMatrix. See get_rank_matrix.
+        sparse : bool
+            If True, the instance stores its preferences as SparsePreferences and its rank matrices as SparseRankMatrix.
+
+        Returns
+        -------
+        SuperStableMatchingInstance
+            The instance with the preferences given by the matrices.
+        """
+        return cls(util.get_prefs_from_rank_matrix(man_rank), util.get_prefs_from_rank_matrix(woman_rank), rounds, banded,
+                   sparse)
+
+    def get_rank_matrix(self, prefs, size):
+        """Builds the rank matrix of preference lists, dense (see util.get_rank_matrix), as a BandedRankMatrix if the
+        instance is banded or as a SparseRankMatrix if it is sparse. All are indexed the same way. In k-range instances,
+        with agents numbered along the master list, every list only spans agents a few k apart, and the reduced GS-lists
+        the rotation search works on are short, so banded matrices take O(nk) memory instead of O(n^2). Sparse matrices
+        take memory proportional to the number of acceptable pairs, whatever their ids.
+
+        Parameters
+        ----------
+        prefs : list
+            List of individual preference lists. Each individual list is a list of lists, to account for indifference.
+        size : int
+            Number of agents that can appear on the lists.
+
+        Returns
+        -------
+        np.ndarray, BandedRankMatrix or SparseRankMatrix
+            The rank matrix.
+        """
+        if self.sparse:
+            return SparseRankMatrix(prefs, size)
+        if self.banded:
+            return BandedRankMatrix(prefs, size)
+        return util.get_rank_matrix(prefs, size)
+
     def is_super_stable(self, matching):
         """Checks whether a matching is super stable in the instance.
 
@@ -160,17 +515,7 @@ class SuperStableMatchingInstance:
         bool
             True if super stable, false if not.
         """
-        for i in range(len(matching)):
-            man = i
-            woman = matching[i]
-            r= util.find_in_list_of_lists(woman, self.male_prefs[i]) # man's ranking of partner
-
-            # iterate over all women man weakly prefers to current partner
-            for tier in range(r):
-                for potential_homewrecker in self.male_prefs[i][tier]:
-                    if self.blocking_status(matching, man, potential_homewrecker) >=0:
-                        return False
-        return True
+        return bool(self.verify_matchings([matching], 'super')[0])
 
     def is_strongly_stable(self, matching):
         """Checks whether a matching is strongly stable in the instance.
@@ -185,17 +530,7 @@ class SuperStableMatchingInstance:
         bool
             True if strongly stable, false if not.
         """
-        for i in range(len(matching)):
-            man = i
-            woman = matching[i]
-            r = util.find_in_list_of_lists(woman, self.male_prefs[i])  # man's ranking of partner
-
-            # iterate over all women man weakly prefers to current partner
-            for tier in range(r):
-                for potential_homewrecker in self.male_prefs[i][tier]:
-                    if self.blocking_status(matching, man, potential_homewrecker) >= 1:
-                        return False
-        return True
+        return bool(self.verify_matchings([matching], 'strong')[0])
 
     def is_weakly_stable(self, matching):
         """Checks whether a matching is weakly stable in the instance.
@@ -210,18 +545,180 @@ class SuperStableMatchingInstance:
         bool
             True if weakly stable, false if not.
         """
-        for i in range(len(matching)):
-            man = i
-            woman = matching[i]
-            r = util.find_in_list_of_lists(woman, self.male_prefs[i])  # man's ranking of partner
-
-            # iterate over all women man strictly prefers to current partner
-            for tier in range(r-1):
-                for potential_homewrecker in self.male_prefs[i][tier]:
-                    if self.blocking_status(matching, man, potential_homewrecker) >= 2:
-                        return False
-        return True
-    def blocking_status(self, matching, man, woman):
+        return bool(self.verify_matchings([matching], 'weak')[0])
+
+    def verify_matchings(self, matchings, stability='super', report=False, chunk_size=256):
+        """Checks a whole set of matchings at once for super, strong or weak stability. The matchings are checked
+        chunk_size at a time, so the blocking statuses in memory never cover more than chunk_size matchings.
+
+        Parameters
+        ----------
+        matchings : list or np.ndarray
+            2d, one matching per row. In each matching, the index represents the man and the value his partner, -1 if
+            he is unmatched.
+        stability : str
+            'super', 'strong' or 'weak'.
+        report : bool
+            If True, also return the blocking pairs of every matching.
+        chunk_size : int
+            Number of matchings checked at once.
+
+        Returns
+        -------
+        np.ndarray
+            Boolean array with one entry per matching, True if the matching is stable.
+        list
+            Only if report is True. For every matching, a list of (man, woman, blocking status) triplets of the pairs
+            that block it. See blocking_status for what the statuses mean.
+        """
+        threshold = {'super': 0, 'strong': 1, 'weak': 2}[stability]
+        matchings = np.asarray(matchings, dtype=np.int64).reshape(-1, self.man_rank.shape[0])
+        stable = np.ones(len(matchings), dtype=bool)
+        pairs = [[] for _ in range(len(matchings))]
+        for start in range(0, len(matchings), chunk_size):
+            chunk = matchings[start:start + chunk_size]
+            if self.sparse:
+                # only acceptable pairs can block, so there is no need to go through every man-woman pair
+                men, women, levels = self.get_acceptable_pair_statuses(chunk)
+                blocking = levels >= threshold
+                stable[start:start + len(chunk)] = ~blocking.any(axis=1)
+                if report:
+                    for i, pair in zip(*np.nonzero(blocking)):
+                        pairs[start + i].append((int(men[pair]), int(women[pair]), int(levels[i, pair])))
+            else:
+                levels = self.get_blocking_statuses(chunk)
+                blocking = levels >= threshold
+                stable[start:start + len(chunk)] = ~blocking.any(axis=(1, 2))
+                if report:
+                    for i, man, woman in zip(*np.nonzero(blocking)):
+                        pairs[start + i].append((int(man), int(woman), int(levels[i, man, woman])))
+        if not report:
+            return stable
+        return stable, pairs
+
+    def get_acceptable_pair_statuses(self, matchings):
+        """Computes the blocking status of every pair acceptable to both agents in every matching, like
+        get_blocking_statuses but with one column per acceptable pair instead of a man by woman grid, so the work and
+        memory are proportional to the number of acceptable pairs. The pairs come from the men's lists, sorted by man
+        then woman.
+
+        Parameters
+        ----------
+        matchings : list or np.ndarray
+            2d, one matching per row. In each matching, the index represents the man and the value his partner, -1 if
+            he is unmatched.
+
+        Returns
+        -------
+        np.ndarray x3
+            The men and the women of the acceptable pairs, and an array of shape (number of matchings, number of pairs)
+            with the blocking status of each pair in each matching.
+        """
+        num_men = self.man_rank.shape[0]
+        num_women = self.woman_rank.shape[0]
+        matchings = np.asarray(matchings, dtype=np.int64).reshape(-1, num_men)
+        count = len(matchings)
+
+        if isinstance(self.male_prefs, SparsePreferences):
+            men, women = self.male_prefs.pairs()
+        else:
+            men, women = SparsePreferences(self.male_prefs).pairs()
+        order = np.lexsort((women, men))
+        men, women = men[order], women[order]
+        mans_woman_rank = np.asarray(self.man_rank[men, women])
+        womans_man_rank = np.asarray(self.woman_rank[women, men])
+        acceptable = womans_man_rank >= 0
+        men, women = men[acceptable], women[acceptable]
+        mans_woman_rank, womans_man_rank = mans_woman_rank[acceptable], womans_man_rank[acceptable]
+
+        # partners' ranks, -1 if unmatched
+        man_partner_rank = np.asarray(self.man_rank[np.arange(num_men)[None, :], matchings])
+        partners = np.full((count, num_women + 1), -1, dtype=np.int64)
+        partners[np.arange(count)[:, None], matchings] = np.arange(num_men)
+        woman_partner_rank = np.asarray(self.woman_rank[np.arange(num_women)[None, :], partners[:, :num_women]])
+
+        # 1 if the agent prefers the pair to their partner (or is unmatched), 0 if indifferent, -1 otherwise
+        man_opinion = self.get_opinions(man_partner_rank[:, men], mans_woman_rank[None, :])
+        woman_opinion = self.get_opinions(woman_partner_rank[:, women], womans_man_rank[None, :])
+
+        statuses = man_opinion + woman_opinion
+        statuses[statuses < 1] = -1
+        statuses[(man_opinion == 0) & (woman_opinion == 0)] = 0
+        statuses[matchings[:, men] == women[None, :]] = -1
+        return men, women, statuses
+
+    def get_blocking_statuses(self, matchings):
+        """Computes the blocking status of every man-woman pair in every matching with array operations on the rank
+        matrices. Statuses are as in blocking_status: -1 if not blocking at all, 0 if it would block a matching from
+        being super stable, 1 if it blocks strongly stable,  2 if it blocks weakly stable. Pairs that are matched to each
+        other or that aren't acceptable to both agents never block.
+
+        Parameters
+        ----------
+        matchings : list or np.ndarray
+            2d, one matching per row. In each matching, the index represents the man and the value his partner, -1 if
+            he is unmatched.
+
+        Returns
+        -------
+        np.ndarray
+            Array of shape (number of matchings, number of men, number of women) with the blocking status of each pair.
+        """
+        man_rank = np.asarray(self.man_rank)  # dense, even if the instance is banded
+        woman_rank = np.asarray(self.woman_rank)
+        num_men = man_rank.shape[0]
+        num_women = woman_rank.shape[0]
+        matchings = np.asarray(matchings, dtype=np.int64).reshape(-1, num_men)
+        count = len(matchings)
+        men = np.arange(num_men)
+
+        # man's rank of his partner, -1 if unmatched thanks to the trailing column of man_rank
+        man_partner_rank = man_rank[men, matchings]
+
+        # partner of each woman in each matching, -1 if unmatched. Unmatched men write into the extra last column.
+        partners = np.full((count, man_rank.shape[1]), -1, dtype=np.int64)
+        partners[np.arange(count)[:, None], matchings] = men
+        woman_partner_rank = woman_rank[np.arange(num_women), partners[:, :num_women]]
+
+        mans_woman_rank = man_rank[None, :, :num_women]
+        womans_man_rank = woman_rank[:, :num_men].T[None, :, :]
+
+        # 1 if the agent prefers the pair to their partner (or is unmatched), 0 if indifferent, -1 otherwise. Built from
+        # comparisons in int8, so no intermediate takes more than a byte per pair and matching
+        man_opinion = self.get_opinions(man_partner_rank[:, :, None], mans_woman_rank)
+        woman_opinion = self.get_opinions(woman_partner_rank[:, None, :], womans_man_rank)
+
+        statuses = man_opinion + woman_opinion
+        statuses[statuses < 1] = -1
+        statuses[(man_opinion == 0) & (woman_opinion == 0)] = 0
+        del man_opinion, woman_opinion
+
+        statuses[np.broadcast_to(~((mans_woman_rank >= 0) & (womans_man_rank >= 0)), statuses.shape)] = -1
+        statuses[matchings[:, :, None] == np.arange(num_women)] = -1
+        return statuses
+
+    @staticmethod
+    def get_opinions(partner_rank, pair_rank):
+        """Compares the rank of each agent's partner to its rank of each pair, broadcasting the two arrays.
+
+        Parameters
+        ----------
+        partner_rank : np.ndarray
+            Ranks of the partners, -1 for unmatched agents.
+        pair_rank : np.ndarray
+            Ranks of the other agent of each pair.
+
+        Returns
+        -------
+        np.ndarray
+            int8 array, 1 where the agent prefers the pair (or is unmatched), 0 where indifferent, -1 otherwise.
+        """
+        unmatched = partner_rank == -1
+        opinions = (unmatched | (partner_rank > pair_rank)).astype(np.int8)
+        opinions -= (~unmatched & (partner_rank < pair_rank))
+        return opinions
+
+    def blocking_status(self, matching, man, woman, matching_inv=None):
         """Checks whether a pair blocks. Returns -1 if not blocking at all, 0 if it would block a matching from being super stable,
         1 if it blocks strongly stable,  2 if it blocks weakly stable
 
@@ -233,6 +730,9 @@ class SuperStableMatchingInstance:
             The man being checked in the pair
         woman : int
             The woman being checked in the pair
+        matching_inv : list
+            The inverse of the matching, see get_partners. Looking up the woman's partner in it takes constant time, so
+            callers checking many pairs of a matching should build it once and pass it. Built here if not given.
 
         Returns
         -------
@@ -242,15 +742,17 @@ class SuperStableMatchingInstance:
         """
 
         # man's ranking of current partner
-        mans_matched_rank = util.find_in_list_of_lists(matching[man], self.male_prefs[man])
+        mans_matched_rank = self.man_rank[man, matching[man]]
 
         # man's ranking of woman
-        mans_woman_rank = util.find_in_list_of_lists(woman, self.male_prefs[man])
+        mans_woman_rank = self.man_rank[man, woman]
 
         # woman's ranking of current partner
-        womans_matched_rank = util.find_in_list_of_lists(matching.index(woman), self.female_prefs[woman])
+        if matching_inv is None:
+            matching_inv = self.get_partners(matching)
+        womans_matched_rank = self.woman_rank[woman, matching_inv[woman]]
         # woman's ranking of man
-        womans_man_rank = util.find_in_list_of_lists(man, self.female_prefs[woman])
+        womans_man_rank = self.woman_rank[woman, man]
 
         if mans_woman_rank == -1: # if the woman isn't a potential partner for the man
             return -1
@@ -279,141 +781,944 @@ class SuperStableMatchingInstance:
 
 # -1, not blocking at all. 0, blocks super only. 1 blocks strongly. 2 blocks weakly
 
-    def count_matchings(self):
-        """Counts the number of super stable matchings in an instance. Creates rotation digraph attribute if not present.
+    def count_matchings(self, forced_pairs=(), forbidden_pairs=()):
+        """Counts the number of super stable matchings in an instance, which is the number of ideals of the rotation poset,
+        without listing them (see util.count_ideals). Creates rotation digraph attribute if not present.
+
+        Parameters
+        ----------
+        forced_pairs : iterable
+            (man, woman) pairs the matchings counted must contain.
+        forbidden_pairs : iterable
+            (man, woman) pairs the matchings counted must not contain.
+
+        Returns
+        -------
+        int
+            number of super stable matchings in an instance
+        """
+        if not hasattr(self, 'man_optimal_SM'):
+            return 0
+        if not hasattr(self, 'rotation_ancestors'):
+            self.create_rotation_digraph()
+        forced_pairs, forbidden_pairs = list(forced_pairs), list(forbidden_pairs)
+        if len(forced_pairs) == 0 and len(forbidden_pairs) == 0:
+            return util.count_ideals(self.rotation_digraph)
+        everything = (1 << len(self.rotations)) - 1
+        count = 0
+        for required, forbidden in self.get_constraint_cases(forced_pairs, forbidden_pairs):
+            count += util.count_ideals(self.rotation_digraph.subgraph(util.get_bits(everything & ~required & ~forbidden)))
+        return count
+
+    def get_pair_rotations(self):
+        """Gets, for every pair in some super stable matching, the rotation that creates it and the one that removes it.
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        dict
+            (man, woman) as key, (creating rotation, removing rotation) as value. The creating rotation is None for pairs
+            of the man optimal matching, the removing rotation None for pairs of the woman optimal matching.
+        """
+        pair_rotations = {(man, woman): [None, None] for man, woman in enumerate(self.man_optimal_SM) if woman != -1}
+        for rotation in range(len(self.rotations)):
+            for man, woman, next in self.get_rotation_changes(self.rotations[rotation], self.cycle_starts[rotation]):
+                pair_rotations[(man, woman)][1] = rotation
+                pair_rotations.setdefault((man, next), [None, None])[0] = rotation
+        return {pair: tuple(rotations) for pair, rotations in pair_rotations.items()}
+
+    def get_constraint_cases(self, forced_pairs, forbidden_pairs):
+        """Translates pair constraints into constraints on the rotations. A pair is in the matching of an ideal when the
+        rotation creating it is eliminated and the one removing it isn't, so forcing a pair requires the first and
+        forbids the second. Avoiding a pair means either the rotation creating it is not eliminated or the one removing
+        it is, two disjoint cases, so the constraints are split into disjoint cases, one per combination.
+
+        Parameters
+        ----------
+        forced_pairs : iterable
+            (man, woman) pairs the matchings must contain.
+        forbidden_pairs : iterable
+            (man, woman) pairs the matchings must not contain.
+
+        Returns
+        -------
+        list
+            List of (required, forbidden) pairs of rotation bitsets, required closed downwards and forbidden upwards,
+            one per feasible case.
+        """
+        pair_rotations = self.get_pair_rotations()
+
+        def require(rotation):
+            return self.get_closure_bits([rotation])
+
+        def forbid(rotation):
+            return (1 << rotation) | self.rotation_descendants[rotation]
+
+        required, forbidden = 0, 0
+        for pair in forced_pairs:
+            if tuple(pair) not in pair_rotations:
+                return []
+            creating, removing = pair_rotations[tuple(pair)]
+            if creating is not None:
+                required |= require(creating)
+            if removing is not None:
+                forbidden |= forbid(removing)
+        cases = [(required, forbidden)]
+        for pair in forbidden_pairs:
+            if tuple(pair) not in pair_rotations:
+                continue
+            creating, removing = pair_rotations[tuple(pair)]
+            options = []
+            if creating is not None:
+                options.append((0, forbid(creating)))
+            if removing is not None:
+                options.append((require(removing), 0))
+            cases = [(required | option_required, forbidden | option_forbidden) for required, forbidden in cases
+                     for option_required, option_forbidden in options]
+        return [(required, forbidden) for required, forbidden in cases if required & forbidden == 0]
+
+    def estimate_matching_count(self, samples=1000, seed=None, confidence=0.95):
+        """Estimates the number of super stable matchings by sequential importance sampling over the rotation poset.
+        Each sample goes through the rotations in a topological order, and eliminates each one whose predecessors have
+        all been eliminated with probability 1/2. An ideal reached after c such coin flips has probability 2^-c, so 2^c
+        is an unbiased estimate of the number of ideals. Samples are drawn together with NumPy, and each costs time
+        linear in the size of the poset. Creates rotation digraph attribute if not present.
+
+        Parameters
+        ----------
+        samples : int
+            Number of samples to draw.
+        seed : int
+            Seed for the random number generator.
+        confidence : float
+            Confidence level of the interval, from a normal approximation.
+
+        Returns
+        -------
+        float
+            The estimated number of super stable matchings.
+        tuple
+            The (low, high) confidence interval of the estimate.
+        """
+        if not hasattr(self, 'man_optimal_SM'):
+            return 0, (0, 0)
+        if not hasattr(self, 'rotation_digraph'):
+            self.create_rotation_digraph()
+
+        rng = np.random.default_rng(seed)
+        graph = self.rotation_digraph
+        eliminated = np.zeros((samples, len(self.rotations)), dtype=bool)
+        flips = np.zeros(samples, dtype=int)
+        for rotation in nx.topological_sort(graph):
+            exposed = eliminated[:, list(graph.predecessors(rotation))].all(axis=1)
+            flips += exposed
+            eliminated[:, rotation] = exposed & (rng.random(samples) < 0.5)
+
+        # the weights are 2^flips, scaled down by the largest one so they fit in a float
+        most = flips.max(initial=0)
+        weights = np.ldexp(1.0, flips - most)
+        mean = weights.mean()
+        error = weights.std(ddof=1) / np.sqrt(samples) if samples > 1 else 0.0
+        z = statistics.NormalDist().inv_cdf((1 + confidence) / 2)
+        return (float(np.ldexp(mean, most)),
+                (float(np.ldexp(max(mean - z * error, 0.0), most)), float(np.ldexp(mean + z * error, most))))
+
+    def sample_matchings(self, count, seed=None, max_states=100000, steps=None):
+        """Draws super stable matchings uniformly at random, without listing them. Ideals of the rotation poset are
+        drawn exactly with util.sample_ideals_exactly when its dynamic program stays under max_states states, and
+        otherwise approximately with the Markov chain of util.sample_ideals_by_chain. Creates rotation digraph attribute
+        if not present.
+
+        Parameters
+        ----------
+        count : int
+            Number of matchings to draw.
+        seed : int
+            Seed for the random number generator.
+        max_states : int
+            Largest number of states the exact sampler may use.
+        steps : int
+            Steps of the Markov chain between samples. Defaults to the square of the number of rotations.
+
+        Returns
+        -------
+        list
+            List of (antichain, rotations, matching) triples: the maximal rotations eliminated, all the rotations
+            eliminated (both sorted lists of rotation indices), and the matching, index being the man and value the
+            woman he's paired with.
+        """
+        if not hasattr(self, 'man_optimal_SM'):
+            return []
+        if not hasattr(self, 'rotation_digraph'):
+            self.create_rotation_digraph()
+
+        rnd = random.Random(seed)
+        ideals = util.sample_ideals_exactly(self.rotation_digraph, count, rnd, max_states)
+        if ideals is None:
+            if steps is None:
+                steps = len(self.rotations) ** 2
+            ideals = util.sample_ideals_by_chain(self.rotation_digraph, count, rnd, steps)
+
+        samples = []
+        for ideal in ideals:
+            samples.append((self.get_maximal_rotations(ideal), sorted(ideal), self.get_matching(ideal)))
+        return samples
+
+    def stable_pairs(self):
+        """Gets the pairs that are in some super stable matching: the pairs of the man optimal matching and the pairs
+        the rotations create. Uses the rotations set by set_all_rotations, so it takes time linear in their size however
+        many matchings there are.
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        list
+            Sorted list of (man, woman) tuples.
+        """
+        return sorted(self.get_stable_pair_set())
+
+    def get_stable_pair_set(self):
+        """Gets the set of the pairs in some super stable matching, see stable_pairs. The set is built once for the
+        current rotations and kept in stable_pair_set, so that is_super_stable_pair is a set lookup.
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        set
+            Set of (man, woman) tuples.
+        """
+        if not hasattr(self, 'man_optimal_SM'):
+            return set()
+        # rebuilt if the rotations have been set again since
+        if getattr(self, 'stable_pair_rotations', None) is not self.rotations:
+            pairs = set((man, woman) for man, woman in enumerate(self.man_optimal_SM) if woman != -1)
+            for rotation, cycle_starts in zip(self.rotations, self.cycle_starts):
+                for man, _, next in self.get_rotation_changes(rotation, cycle_starts):
+                    pairs.add((man, next))
+            self.stable_pair_set = pairs
+            self.stable_pair_rotations = self.rotations
+        return self.stable_pair_set
+
+    def fixed_pairs(self):
+        """Gets the pairs that are in every super stable matching. A man's partner only gets worse from the man optimal
+        matching to the woman optimal one, so these are the pairs the two have in common.
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        list
+            Sorted list of (man, woman) tuples.
+        """
+        if not hasattr(self, 'man_optimal_SM'):
+            return []
+        return [(man, woman) for man, woman in enumerate(self.man_optimal_SM) if
+                woman != -1 and self.woman_optimal_SM[man] == woman]
+
+    def is_super_stable_pair(self, man, woman):
+        """Checks whether a pair is in some super stable matching. Uses the rotations set by set_all_rotations, through
+        get_stable_pair_set, so after the first query each one takes constant time.
+
+        Parameters
+        ----------
+        man : int
+            The man.
+        woman : int
+            The woman.
+
+        Returns
+        -------
+        bool
+            True if the man and woman are paired in some super stable matching.
+        """
+        return (man, woman) in self.get_stable_pair_set()
+
+    def optimal_matching(self, objective='egalitarian'):
+        """Finds a super stable matching that is optimal for an objective, without listing the matchings.
+
+        For a cost that is a sum over the pairs of the matching ('egalitarian', or a weight function), eliminating a
+        rotation changes the cost by the same amount whatever other rotations were eliminated, so the optimal matching
+        is given by a maximum weight closure of the rotation poset, found with one minimum cut. 'minimum-regret' tries
+        the possible regrets in increasing order: a regret is reachable if the rotations that would give a man a worse
+        partner are disjoint from the closure of the ones that give each woman a good enough one. Finding a sex-equal
+        matching is NP-hard, so 'sex-equal' goes through every matching with walk_ideals.
+
+        Parameters
+        ----------
+        objective : str or callable
+            'egalitarian' minimizes the sum of the ranks every matched agent gives their partner. 'minimum-regret'
+            minimizes the largest of those ranks. 'sex-equal' minimizes the difference between the sum of the ranks of
+            the men and the sum of the ranks of the women. A function weight(man, woman) minimizes the sum of the
+            weights of the pairs in the matching. Ranks are tier indices in the original preference lists.
+
+        Returns
+        -------
+        list
+            The matching, index being the man and value the woman he's paired with. None if there is no super stable
+            matching.
+        number
+            The value of the objective for the matching.
+        """
+        if objective not in ('minimum-regret', 'sex-equal', 'egalitarian') and not callable(objective):
+            raise ValueError(f"unknown objective {objective!r}, expected 'egalitarian', 'minimum-regret', 'sex-equal' "
+                             f"or a function weight(man, woman)")
+        if not hasattr(self, 'man_optimal_SM'):
+            return None, None
+        if not hasattr(self, 'rotation_ancestors'):
+            self.create_rotation_digraph()
+
+        if objective == 'minimum-regret':
+            return self.get_minimum_regret_matching()
+        if objective == 'sex-equal':
+            return self.get_sex_equal_matching()
+        weight = self.get_pair_weight(objective)
+        ideal = util.get_max_weight_closure(self.rotation_digraph, self.get_rotation_profits(weight))
+        matching = self.get_matching(ideal)
+        return matching, sum(weight(man, matching[man]) for man in range(len(matching)) if matching[man] != -1)
+
+    def get_pair_weight(self, objective):
+        """Gets the weight function of a cost that is a sum over the pairs of a matching.
+
+        Parameters
+        ----------
+        objective : str or callable
+            'egalitarian', for the sum of the ranks both agents give each other, or a function weight(man, woman).
+
+        Returns
+        -------
+        callable
+            Function weight(man, woman).
+        """
+        if objective == 'egalitarian':
+            return lambda man, woman: int(self.man_rank[man, woman] + self.woman_rank[woman, man])
+        if not callable(objective):
+            raise ValueError(f"unknown objective {objective!r}, expected 'egalitarian' or a function weight(man, woman)")
+        return objective
+
+    def get_rotation_profits(self, weight):
+        """Gets how much eliminating each rotation lowers the total weight of a matching, which is the same whatever
+        other rotations were eliminated.
+
+        Parameters
+        ----------
+        weight : callable
+            Function weight(man, woman).
+
+        Returns
+        -------
+        dict
+            Rotation index as key, decrease in weight as value.
+        """
+        profits = {}
+        for rotation in range(len(self.rotations)):
+            changes = self.get_rotation_changes(self.rotations[rotation], self.cycle_starts[rotation])
+            profits[rotation] = sum(weight(man, woman) - weight(man, next) for man, woman, next in changes)
+        return profits
+
+    def top_k_matchings(self, k, weight='egalitarian'):
+        """Generates the k super stable matchings of lowest total weight, in nondecreasing order of weight, without
+        listing the matchings. Best-first branch and bound over decisions to eliminate or keep rotations: a subproblem
+        is a set of rotations that must be eliminated and a set that must not, and its best matching is a maximum weight
+        closure of the remaining rotations, found with a minimum cut. When a subproblem's best matching is output, the
+        rest of the subproblem is split by fixing its rotations one at a time to that matching's choice but the last,
+        which is flipped. Each matching output costs a minimum cut per undecided rotation.
+
+        Parameters
+        ----------
+        k : int
+            Number of matchings to generate.
+        weight : str or callable
+            'egalitarian', for the sum of the ranks both agents give each other, or a function weight(man, woman).
+
+        Returns
+        -------
+        generator
+            Generator of (matching, weight) pairs.
+        """
+        if not hasattr(self, 'man_optimal_SM') or k <= 0:
+            return
+        if not hasattr(self, 'rotation_ancestors'):
+            self.create_rotation_digraph()
+        weight = self.get_pair_weight(weight)
+        profits = self.get_rotation_profits(weight)
+        base = sum(weight(man, woman) for man, woman in enumerate(self.man_optimal_SM) if woman != -1)
+        everything = (1 << len(self.rotations)) - 1
+
+        def solve(required, forbidden):
+            # best closure containing required and avoiding forbidden, as a bitset
+            free = util.get_bits(everything & ~required & ~forbidden)
+            ideal = util.get_max_weight_closure(self.rotation_digraph.subgraph(free), profits)
+            bits = required
+            for rotation in ideal:
+                bits |= 1 << rotation
+            return base - sum(profits[rotation] for rotation in util.get_bits(bits)), bits
+
+        heap = []
+        count = 0  # breaks ties in the heap
+        cost, bits = solve(0, 0)
+        heapq.heappush(heap, (cost, count, bits, 0, 0))
+        found = 0
+        while heap and found < k:
+            cost, _, bits, required, forbidden = heapq.heappop(heap)
+            yield self.get_matching(set(util.get_bits(bits))), cost
+            found += 1
+
+            # split the rest of the subproblem
+            for rotation in util.get_bits(everything & ~required & ~forbidden):
+                if (required | forbidden) >> rotation & 1:
+                    continue  # decided by an earlier fixing
+                if bits >> rotation & 1:
+                    child_required, child_forbidden = required, forbidden | (1 << rotation) | self.rotation_descendants[rotation]
+                    required |= self.get_closure_bits([rotation])
+                else:
+                    child_required, child_forbidden = required | self.get_closure_bits([rotation]), forbidden
+                    forbidden |= (1 << rotation) | self.rotation_descendants[rotation]
+                if child_required & child_forbidden == 0:
+                    child_cost, child_bits = solve(child_required, child_forbidden)
+                    count += 1
+                    heapq.heappush(heap, (child_cost, count, child_bits, child_required, child_forbidden))
+
+    def get_minimum_regret_matching(self):
+        """Finds a super stable matching minimizing the largest rank an agent gives their partner. See
+        optimal_matching.
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        list
+            The matching, index being the man and value the woman he's paired with.
+        int
+            Its regret.
+        """
+        M0 = self.man_optimal_SM
+        M0_inv = self.get_partners(M0)
+        # for each rotation, the largest rank a man gets and, for each woman, her rank before and after it
+        man_worst = []
+        woman_moves = []
+        for rotation in range(len(self.rotations)):
+            changes = self.get_rotation_changes(self.rotations[rotation], self.cycle_starts[rotation])
+            old_partner = {woman: man for man, woman, _ in changes}
+            man_worst.append(max(int(self.man_rank[man, next]) for man, _, next in changes))
+            woman_moves.append([(next, int(self.woman_rank[next, old_partner[next]]), int(self.woman_rank[next, man]))
+                                for man, _, next in changes])
+        men_ranks = [int(self.man_rank[man, woman]) for man, woman in enumerate(M0) if woman != -1]
+        women_ranks = [int(self.woman_rank[woman, man]) for woman, man in enumerate(M0_inv) if man != -1]
+        # 0 is the regret of a matching where nobody is matched
+        candidates = sorted(set([0] + men_ranks + women_ranks + man_worst +
+                                [rank for moves in woman_moves for _, _, rank in moves]))
+
+        for regret in candidates:
+            if max(men_ranks, default=0) > regret:
+                continue
+            # rotations that would give a man a partner he ranks worse than the regret, and everything after them
+            forbidden = 0
+            for rotation in range(len(self.rotations)):
+                if man_worst[rotation] > regret:
+                    forbidden |= (1 << rotation) | self.rotation_descendants[rotation]
+            # rotations that give a woman a partner she ranks at the regret or better
+            needed = set(woman for woman, man in enumerate(M0_inv) if man != -1 and self.woman_rank[woman, man] > regret)
+            required = []
+            for rotation in range(len(self.rotations)):
+                for woman, before, after in woman_moves[rotation]:
+                    if woman in needed and before > regret >= after:
+                        needed.discard(woman)
+                        required.append(rotation)
+            if len(needed) > 0:
+                continue
+            closure = self.get_closure_bits(required)
+            if closure & forbidden == 0:
+                return self.get_matching(set(util.get_bits(closure))), regret
+        return None, None
+
+    def get_sex_equal_matching(self):
+        """Finds a super stable matching minimizing the difference between the sum of the ranks the men give their
+        partners and the sum of the ranks the women give theirs, by going through every matching. See optimal_matching.
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        list
+            The matching, index being the man and value the woman he's paired with.
+        int
+            Its difference in sums of ranks.
+        """
+        best = None
+        best_cost = None
+        for _, _, matching in self.walk_ideals():
+            cost = abs(sum(int(self.man_rank[man, woman] - self.woman_rank[woman, man])
+                           for man, woman in enumerate(matching) if woman != -1))
+            if best_cost is None or cost < best_cost:
+                best = list(matching)
+                best_cost = cost
+        return best, best_cost
+
+    def get_matching(self, ideal):
+        """Gets the matching given by eliminating a closed set of rotations from the man optimal matching.
+
+        Parameters
+        ----------
+        ideal : set
+            Indices of the rotations eliminated. Must contain every predecessor of its rotations.
+
+        Returns
+        -------
+        list
+            The matching, index being the man and value the woman he's paired with.
+        """
+        if not hasattr(self, 'rotation_digraph'):
+            self.create_rotation_digraph()
+        matching = list(self.man_optimal_SM)
+        for rotation in nx.topological_sort(self.rotation_digraph):
+            if rotation in ideal:
+                for man, woman, next in self.get_rotation_changes(self.rotations[rotation], self.cycle_starts[rotation]):
+                    assert matching[man] == woman, f"rotation {self.rotations[rotation]} not exposed in {matching}, {self.male_prefs}, {self.female_prefs}"
+                    matching[man] = next
+        return matching
+
+    def eliminate_rotation(self, og_matching, rotation, cycle_indices):
+        """Eliminates rotation from matching. Checks instance prefs and throws assertion error if rotation is not exposed.
+
+        Parameters
+        ----------
+        og_matching : list
+            List that represents a matching. Index represents the man, value the woman.
+        rotation : list of tuples
+            List of tuples representing a rotation. Each tuple is formatted as (man, woman)
+
+        Returns
+        -------
+        list
+            The matching after the rotation is eliminated.
+        """
+        matching = deepcopy(og_matching)
+        for pair in rotation:
+            assert matching[pair[0]] == pair[1], f"rotation {rotation} not exposed in {matching}, {self.male_prefs}, {self.female_prefs}"
+
+        cycles = [(rotation + [''])[slice(ix, iy)] for ix, iy in zip([0] + cycle_indices, cycle_indices + [-1])]
+
+        for cycle in cycles:
+            for i in range(len(cycle)):
+                man, woman = cycle[i]
+                next = cycle[(i+1)%len(cycle)][1]
+                matching[man] = next
+        return matching
+
+    def get_all_predecessor(self, graph, node):
+        """Finds the predecessors of a node in the rotation poset, using the closure index when graph is the rotation
+        digraph.
+
+        Parameters
+        ----------
+        graph : DiGraph
+            The rotation poset.
+        node : int
+            the index of the rotation in self.rotations
+
+        Returns
+        -------
+        dict
+            a dict with the indices of the predecessors as keys, 1 as the values. Predecessors come before their
+            successors, and node is last.
+        """
+        if graph is getattr(self, 'rotation_digraph', None):
+            ancestors = self.get_required_rotations([node])
+            ancestors.sort(key=lambda r: bin(self.rotation_ancestors[r]).count('1'))
+            return dict.fromkeys(ancestors, 1)
+        ancestors = nx.ancestors(graph, node)
+        total = dict.fromkeys((r for r in nx.topological_sort(graph) if r in ancestors), 1)
+        total[node] = 1
+        return total
+
+    def set_all_matchings(self):
+        """Sets and returns all the super stable matchings for the instance. The matchings are found by walk_ideals,
+        so they are listed in the order it visits the ideals of the rotation poset.
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        list
+            The super stable matchings, each a list with index being the man and value the woman he's paired with.
+        """
+        if not hasattr(self, 'man_optimal_SM'):
+            return 0
+
+        self.matchings = list(self.iter_matchings())
+        return self.matchings
+
+    def iter_matchings(self, reuse_buffer=False, forced_pairs=(), forbidden_pairs=()):
+        """Generates the super stable matchings of the instance one at a time, without keeping them in memory.
+
+        Parameters
+        ----------
+        reuse_buffer : bool
+            If True, every matching is written into the same NumPy array, which is yielded each time. Copy it to keep it.
+            Otherwise each matching is a new list.
+        forced_pairs : iterable
+            (man, woman) pairs the matchings generated must contain.
+        forbidden_pairs : iterable
+            (man, woman) pairs the matchings generated must not contain. Only the ideals meeting the constraints are
+            walked, see get_constraint_cases.
+
+        Returns
+        -------
+        generator
+            Generator of matchings, index being the man and value the woman he's paired with.
+        """
+        forced_pairs, forbidden_pairs = list(forced_pairs), list(forbidden_pairs)
+        if len(forced_pairs) == 0 and len(forbidden_pairs) == 0:
+            walks = [self.walk_ideals()]
+        else:
+            if not hasattr(self, 'man_optimal_SM'):
+                return
+            if not hasattr(self, 'rotation_ancestors'):
+                self.create_rotation_digraph()
+            walks = (self.walk_ideals(required, forbidden) for required, forbidden in
+                     self.get_constraint_cases(forced_pairs, forbidden_pairs))
+        buffer = np.empty(len(self.male_prefs), dtype=int)
+        for walk in walks:
+            for _, _, matching in walk:
+                if reuse_buffer:
+                    buffer[:] = matching
+                    yield buffer
+                else:
+                    yield list(matching)
+
+    def iter_antichains(self):
+        """Generates the antichains of the rotation poset, in the same order iter_matchings generates the matchings they
+        give. The antichain of a matching is the set of rotations that are maximal among those eliminated to reach it.
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        generator
+            Generator of sorted lists of rotation indices.
+        """
+        for _, maximal, _ in self.walk_ideals():
+            yield sorted(maximal)
+
+    def get_rotation_changes(self, rotation, cycle_indices):
+        """Gets the changes eliminating a rotation makes to a matching.
+
+        Parameters
+        ----------
+        rotation : list of tuples
+            List of tuples representing a rotation. Each tuple is formatted as (man, woman)
+        cycle_indices : list
+            The indices in the rotation where a cycle starts.
+
+        Returns
+        -------
+        list
+            List of tuples (man, woman before, woman after), one per pair in the rotation.
+        """
+        changes = []
+        for ix, iy in zip([0] + cycle_indices, cycle_indices + [len(rotation)]):
+            cycle = rotation[ix:iy]
+            for i in range(len(cycle)):
+                man, woman = cycle[i]
+                changes.append((man, woman, cycle[(i + 1) % len(cycle)][1]))
+        return changes
+
+    def walk_ideals(self, required=0, forbidden=0):
+        """Walks the ideals (closed sets) of the rotation poset depth first, starting from the empty ideal. An ideal is
+        extended by eliminating one exposed rotation that comes after the last one eliminated in a topological order of
+        the poset, so each ideal is visited once, and backtracking undoes that one rotation. A single matching is
+        updated in place, and the rotations that can extend an ideal are those that could extend its parent and come
+        later, merged with the successors the rotation exposed. So visiting an ideal costs O(|rho| + w), for the size of
+        the rotation rho that changed and the number w of rotations that can extend the ideal (at most the width of the
+        poset), rather than time proportional to the size of the ideal. Throws an assertion error if a rotation is not
+        exposed when eliminated, like eliminate_rotation.
+
+        Parameters
+        ----------
+        required : int
+            Bitset of rotations every ideal must contain, closed downwards. The walk starts from their matching.
+        forbidden : int
+            Bitset of rotations no ideal may contain, closed upwards.
+
+        Returns
+        -------
+        generator
+            Generator of (ideal, maximal, matching) triples, where ideal is the list of the rotations eliminated, in the
+            order they were eliminated, maximal is the set of the maximal rotations in the ideal (its antichain), and
+            matching is the matching they give, index being the man and value the woman. All three are updated in place
+            as the walk continues, so copy them to keep them. With required rotations, ideal and maximal only have the
+            rotations eliminated beyond them.
+        """
+        if not hasattr(self, 'man_optimal_SM'):
+            return
+        if not hasattr(self, 'rotation_digraph'):
+            self.create_rotation_digraph()
+
+        graph = self.rotation_digraph
+        if required or forbidden:
+            graph = graph.subgraph(r for r in graph if not (required | forbidden) >> r & 1)
+        position = {rotation: i for i, rotation in enumerate(nx.topological_sort(graph))}
+        changes = [self.get_rotation_changes(self.rotations[i], self.cycle_starts[i]) for i in range(len(self.rotations))]
+        missing = {rotation: graph.in_degree(rotation) for rotation in graph}  # predecessors not yet eliminated
+        covered = dict.fromkeys(graph, 0)  # successors eliminated
+
+        matching = self.get_matching(set(util.get_bits(required))) if required else list(self.man_optimal_SM)
+        ideal = []
+        maximal = set()
+        yield ideal, maximal, matching
+
+        # each frame holds the rotations that can still extend the current ideal, last one first
+        stack = [sorted((r for r in graph if missing[r] == 0), key=position.__getitem__, reverse=True)]
+        while stack:
+            if not stack[-1]:
+                stack.pop()
+                if not ideal:
+                    break
+                # undo the last rotation
+                rotation = ideal.pop()
+                for man, woman, _ in changes[rotation]:
+                    matching[man] = woman
+                for successor in graph.successors(rotation):
+                    missing[successor] += 1
+                maximal.discard(rotation)
+                for predecessor in graph.predecessors(rotation):
+                    covered[predecessor] -= 1
+                    if covered[predecessor] == 0:
+                        maximal.add(predecessor)
+                continue
+
+            rotation = stack[-1].pop()
+            for man, woman, _ in changes[rotation]:
+                assert matching[man] == woman, f"rotation {self.rotations[rotation]} not exposed in {matching}, {self.male_prefs}, {self.female_prefs}"
+            for man, _, woman in changes[rotation]:
+                matching[man] = woman
+            ideal.append(rotation)
+            newly_exposed = []  # successors come after the rotation in the topological order
+            for successor in graph.successors(rotation):
+                missing[successor] -= 1
+                if missing[successor] == 0:
+                    newly_exposed.append(successor)
+            maximal.add(rotation)
+            for predecessor in graph.predecessors(rotation):
+                if covered[predecessor] == 0:
+                    maximal.discard(predecessor)
+                covered[predecessor] += 1
+            yield ideal, maximal, matching
+
+            # the rest of the parent's frame comes after the rotation, since frames are used up in topological order
+            newly_exposed.sort(key=position.__getitem__, reverse=True)
+            stack.append(list(heapq.merge(stack[-1], newly_exposed, key=position.__getitem__, reverse=True)))
+
+    def create_rotation_digraph(self, reduced=False):
+        """Sets the instance's rotation digraph attribute.
 
         Parameters
         ----------
-        None
+        reduced : bool
+            If True, the rotation digraph only has the edges of the Hasse diagram of the rotation poset (its transitive
+            reduction), see get_hasse_edges. rotation_digraph_edges keeps all the type 1 and type 2 edges either way.
 
         Returns
         -------
-        int
-            number of super stable matchings in an instance
+        None
         """
-        if not hasattr(self, 'man_optimal_SM'):
-            return 0
-        if not hasattr(self, 'rotation_digraph'):
-            self.create_rotation_digraph()
-        return sum(1 for _ in nx.algorithms.dag.antichains(self.rotation_digraph))
+        self.rotation_digraph_edges = self.get_rotation_digraph_edges(self.rotations)
+        nodes = range(len(self.rotations))
+        edges = set([(edge[1], edge[2]) for edge in self.rotation_digraph_edges])
 
-    def eliminate_rotation(self, og_matching, rotation, cycle_indices):
-        """Eliminates rotation from matching. Checks instance prefs and throws assertion error if rotation is not exposed.
+        self.rotation_digraph = nx.DiGraph()
+        self.rotation_digraph.add_nodes_from(nodes)
+        self.rotation_digraph.add_edges_from(edges)
+        self.set_rotation_closure_index()
+        if reduced:
+            hasse_edges = self.get_hasse_edges()
+            self.rotation_digraph = nx.DiGraph()
+            self.rotation_digraph.add_nodes_from(nodes)
+            self.rotation_digraph.add_edges_from(hasse_edges)
+
+    def get_hasse_edges(self):
+        """Gets the edges of the Hasse diagram of the rotation poset. An edge (a, b) of the rotation digraph is in it
+        unless a is below another predecessor of b, which the closure index answers with one bitset operation per
+        predecessor.
 
         Parameters
         ----------
-        og_matching : list
-            List that represents a matching. Index represents the man, value the woman.
-        rotation : list of tuples
-            List of tuples representing a rotation. Each tuple is formatted as (man, woman)
+        None
 
         Returns
         -------
         list
-            The matching after the rotation is eliminated.
+            Sorted list of (from, to) edges.
         """
-        matching = deepcopy(og_matching)
-        for pair in rotation:
-            assert matching[pair[0]] == pair[1], f"rotation {rotation} not exposed in {matching}, {self.male_prefs}, {self.female_prefs}"
-
-        cycles = [(rotation + [''])[slice(ix, iy)] for ix, iy in zip([0] + cycle_indices, cycle_indices + [-1])]
+        if not hasattr(self, 'rotation_ancestors'):
+            self.create_rotation_digraph()
+        edges = []
+        for rotation in self.rotation_digraph:
+            predecessors = list(self.rotation_digraph.predecessors(rotation))
+            implied = 0  # everything below some predecessor
+            for predecessor in predecessors:
+                implied |= self.rotation_ancestors[predecessor]
+            for predecessor in predecessors:
+                if not implied >> predecessor & 1:
+                    edges.append((predecessor, rotation))
+        return sorted(edges)
+
+    def set_rotation_closure_index(self):
+        """Sets the reachability index of the rotation poset: for every rotation, a bitset (a Python int, bit i for rotation
+        i) of the rotations that must be eliminated before it and one of the rotations that can only be eliminated after
+        it. Built with one sweep in topological order and one in reverse, so closure and comparability queries take a
+        few word-parallel operations.
 
-        for cycle in cycles:
-            for i in range(len(cycle)):
-                man, woman = cycle[i]
-                next = cycle[(i+1)%len(cycle)][1]
-                matching[man] = next
-        return matching
+        Parameters
+        ----------
+        None
 
-    def get_all_predecessor(self, graph, node):
-        """Recursively finds the predecessors of a node in the rotation poset.
+        Returns
+        -------
+        None
+        """
+        graph = self.rotation_digraph
+        order = list(nx.topological_sort(graph))
+        self.rotation_ancestors = [0] * len(self.rotations)
+        self.rotation_descendants = [0] * len(self.rotations)
+        for rotation in order:
+            for predecessor in graph.predecessors(rotation):
+                self.rotation_ancestors[rotation] |= self.rotation_ancestors[predecessor] | (1 << predecessor)
+        for rotation in reversed(order):
+            for successor in graph.successors(rotation):
+                self.rotation_descendants[rotation] |= self.rotation_descendants[successor] | (1 << successor)
+
+    def rotation_poset_metrics(self, time_budget=10):
+        """Gets the height, width and pathwidth of the rotation poset. The height is the number of rotations in the
+        longest chain and the width the size of the largest antichain (see util.get_poset_height and
+        util.get_poset_width). The pathwidth is that of the Hasse diagram as an undirected graph, found by branch and bound
+        within the time budget (see util.get_pathwidth). Creates rotation digraph attribute if not present.
 
         Parameters
         ----------
-        graph : DiGraph
-            The rotation poset.
-        node : int
-            the index of the rotation in self.rotations
+        time_budget : float
+            Seconds the pathwidth search may run.
 
         Returns
         -------
         dict
-            a dict with the indices of the predecessors as keys, 1 as the values.
+            With keys 'height', 'width', 'pathwidth', and 'pathwidth_lower_bound', which equals 'pathwidth' when the
+            search finished and 'pathwidth' is exact.
         """
-        parents = list(graph.predecessors(node))
-        if parents ==[]:
-            return {node: 1}
-        total = self.get_all_predecessor(graph, parents[0])
-        for parent in parents[1:]:
-            total.update(self.get_all_predecessor(graph, parent))
-        total[node] = 1
-        return total
+        if not hasattr(self, 'man_optimal_SM'):
+            return {'height': 0, 'width': 0, 'pathwidth': 0, 'pathwidth_lower_bound': 0}
+        if not hasattr(self, 'rotation_ancestors'):
+            self.create_rotation_digraph()
+        pathwidth, lower_bound = util.get_pathwidth(self.get_hasse_edges(), time_budget)
+        return {'height': util.get_poset_height(self.rotation_digraph),
+                'width': util.get_poset_width(self.rotation_descendants),
+                'pathwidth': pathwidth,
+                'pathwidth_lower_bound': lower_bound}
 
-    def set_all_matchings(self):
-        """Sets and returns all the super stable matchings for the instance.
+    def get_closure_bits(self, rotations):
+        """Gets the bitset of the rotations that must be eliminated to eliminate the given ones, including them.
 
         Parameters
         ----------
-        file_loc : str
-            The file location of the spreadsheet
-        print_cols : bool, optional
-            A flag used to print the columns to the console (default is
-            False)
+        rotations : iterable
+            Indices of rotations.
 
         Returns
         -------
-        list
-            a list of strings used that are the header columns
+        int
+            Bitset with bit i set if rotation i is in the closure.
         """
-        if not hasattr(self, 'man_optimal_SM'):
-            return 0
-        if not hasattr(self, 'rotation_digraph'):
+        if not hasattr(self, 'rotation_ancestors'):
             self.create_rotation_digraph()
+        closure = 0
+        for rotation in rotations:
+            closure |= self.rotation_ancestors[rotation] | (1 << rotation)
+        return closure
 
-        antichains = list(nx.algorithms.dag.antichains(self.rotation_digraph))
+    def get_required_rotations(self, antichain):
+        """Gets the rotations required to reach the matching of an antichain, i.e. the antichain and everything below it.
 
-        matchings = []
-        for antichain in antichains:
-            all_rotations = {}
-            matching = deepcopy(self.man_optimal_SM)
-            for terminal_rotation in antichain:
-                all_rotations[terminal_rotation] = 1
-                # dict of keys being the indices of rotations involved to reach the matching
-                all_rotations = {**self.get_all_predecessor(self.rotation_digraph,terminal_rotation), **all_rotations}
+        Parameters
+        ----------
+        antichain : iterable
+            Indices of rotations.
 
-            for rotation in all_rotations:
-                matching = self.eliminate_rotation(matching, self.rotations[rotation], self.cycle_starts[rotation])
+        Returns
+        -------
+        list
+            Sorted indices of the rotations.
+        """
+        return util.get_bits(self.get_closure_bits(antichain))
 
-            matchings.append(matching)
-        self.matchings = matchings
-        return matchings
-    def create_rotation_digraph(self):
-        """Sets the instance's rotation digraph attribute.
+    def are_comparable(self, rotation1, rotation2):
+        """Checks whether one of two rotations must be eliminated before the other.
 
         Parameters
         ----------
-        None
+        rotation1 : int
+            Index of a rotation.
+        rotation2 : int
+            Index of a rotation.
 
         Returns
         -------
-        None
+        bool
+            True if the rotations are comparable in the rotation poset.
         """
-        self.rotation_digraph_edges = self.get_rotation_digraph_edges(self.rotations)
-        nodes = range(len(self.rotations))
-        edges = set([(edge[1], edge[2]) for edge in self.rotation_digraph_edges])
+        if not hasattr(self, 'rotation_ancestors'):
+            self.create_rotation_digraph()
+        return rotation1 == rotation2 or bool((self.rotation_ancestors[rotation1] | self.rotation_descendants[rotation1])
+                                              >> rotation2 & 1)
 
-        self.rotation_digraph = nx.DiGraph()
-        self.rotation_digraph.add_nodes_from(nodes)
-        self.rotation_digraph.add_edges_from(edges)
+    def get_maximal_rotations(self, rotations):
+        """Gets the antichain of a closed set of rotations: the rotations in it with nothing above them in it.
+
+        Parameters
+        ----------
+        rotations : iterable
+            Indices of rotations.
+
+        Returns
+        -------
+        list
+            Sorted indices of the maximal rotations.
+        """
+        if not hasattr(self, 'rotation_descendants'):
+            self.create_rotation_digraph()
+        bits = 0
+        for rotation in rotations:
+            bits |= 1 << rotation
+        return [rotation for rotation in util.get_bits(bits) if self.rotation_descendants[rotation] & bits == 0]
 
 
 
-    def set_extreme_SMs(self):
+    def set_extreme_SMs(self, rounds=False):
         """sets the man optimal and woman optimal stable matchings, as well as the reduced GS-lists
 
         Parameters
         ----------
-        None
+        rounds : bool
+            If True, use get_gendered_GS_list_by_rounds, where every free agent proposes at once, instead of
+            get_gendered_GS_list_incomplete_prefs. Both give the same lists.
 
         Returns
         -------
@@ -422,10 +1727,24 @@ class SuperStableMatchingInstance:
         # if they've been set, return
         if hasattr(self,"male_prefs_MGS"):
             return
-        male_prefs_MGS, female_prefs_MGS, self.unmatched_men, self.unmatched_women = self.get_gendered_GS_list_incomplete_prefs(
-            self.male_prefs, self.female_prefs)
-        female_prefs_FGS, male_prefs_FGS, unmatched_women2, unmatched_men2 = self.get_gendered_GS_list_incomplete_prefs(
-            self.female_prefs, self.male_prefs)
+        if rounds:
+            male_prefs_MGS, female_prefs_MGS, self.unmatched_men, self.unmatched_women = self.get_gendered_GS_list_by_rounds(
+                self.male_prefs, self.female_prefs, self.man_rank, self.woman_rank)
+        else:
+            male_prefs_MGS, female_prefs_MGS, self.unmatched_men, self.unmatched_women = self.get_gendered_GS_list_incomplete_prefs(
+                self.male_prefs, self.female_prefs)
+
+        # if the man-proposing pass finds there is no SSM, the woman-proposing pass would too
+        if male_prefs_MGS is None:
+            self.male_prefs_MGS = self.female_prefs_MGS = self.male_prefs_FGS = self.female_prefs_FGS = None
+            return
+
+        if rounds:
+            female_prefs_FGS, male_prefs_FGS, unmatched_women2, unmatched_men2 = self.get_gendered_GS_list_by_rounds(
+                self.female_prefs, self.male_prefs, self.woman_rank, self.man_rank)
+        else:
+            female_prefs_FGS, male_prefs_FGS, unmatched_women2, unmatched_men2 = self.get_gendered_GS_list_incomplete_prefs(
+                self.female_prefs, self.male_prefs)
 
         if unmatched_men2 is not None and self.unmatched_men is not None:
             assert unmatched_men2.sort() == self.unmatched_men.sort()
@@ -442,19 +1761,23 @@ class SuperStableMatchingInstance:
         # set GS lists (intersection of FGS and MGS lists)
         for i in range(len(male_prefs_MGS)):
             self.male_prefs_GSlist.append([])
+            FGS_prefs = set(pref for tier in male_prefs_FGS[i] for pref in tier)
             for tier in male_prefs_MGS[i]:
-                new_tier = [pref for pref in tier if util.find_in_list_of_lists(pref, male_prefs_FGS[i])>= 0]
+                new_tier = [pref for pref in tier if pref in FGS_prefs]
                 if new_tier != []:
                     self.male_prefs_GSlist[i].append(new_tier)
 
 
         for i in range(len(female_prefs_MGS)):
             self.female_prefs_GSlist.append([])
-
+            FGS_prefs = set(pref for tier in female_prefs_FGS[i] for pref in tier)
             for tier in female_prefs_MGS[i]:
-                new_tier = [pref for pref in tier if util.find_in_list_of_lists(pref, female_prefs_FGS[i])>= 0]
+                new_tier = [pref for pref in tier if pref in FGS_prefs]
                 if new_tier != []:
                     self.female_prefs_GSlist[i].append(new_tier)
+        self.man_GSlist_rank = self.get_rank_matrix(self.male_prefs_GSlist, self.num_women)
+        self.woman_GSlist_rank = self.get_rank_matrix(self.female_prefs_GSlist, self.num_men)
+        self.blocks = self.get_blocks()
 
         # set man optimal, woman optimal SMs, both with man as index woman as value
 
@@ -471,10 +1794,16 @@ class SuperStableMatchingInstance:
 
 
 
-    def get_gendered_GS_list_incomplete_prefs(self, proposer_prefs_orig,
-                                              proposee_prefs_orig):  # algorithm SUPER2 from Manlove
+    @staticmethod
+    def get_gendered_GS_list_incomplete_prefs(proposer_prefs_orig, proposee_prefs_orig):  # algorithm SUPER2 from Manlove
         """Runs the algorithm SUPER2 from Manlove to get the man-optimal or woman-optimal lists.
 
+        Free proposers wait in a queue and propose in the order they became free, so the result doesn't depend on the
+        random module. Each agent keeps a pointer to its first (proposers) or last (proposees) tier that may still have
+        agents on it, and deleted pairs are only flagged, so the lists are never rebuilt. Multiple engagements are
+        detected as they happen, when a proposal is made. Apart from rescanning a tier, all the work is
+        O(total length of the lists).
+
         Parameters
         ----------
         proposer_prefs_orig : list
@@ -486,146 +1815,239 @@ class SuperStableMatchingInstance:
 
         Returns
         -------
-        list x2
-            The proposer-optimal GS list of the proposer prefs, the proposer-optimal GS list of the proposee prefs.
+        list x4
+            The proposer-optimal GS list of the proposer prefs, the proposer-optimal GS list of the proposee prefs, the
+            unmatched proposers and the unmatched proposees. All None if there is no super-stable matching.
 
         """
-        free = []
-        proposer_prefs = deepcopy(proposer_prefs_orig)
-        proposee_prefs = deepcopy(proposee_prefs_orig)
-
-        proposed = np.zeros(len(proposee_prefs))  # array storing whether or not a given woman has been proposed to
-        matchings = []
-        for i in range(len(proposer_prefs)):
-            matchings.append([])  # matchings is list of lists, with index being proposer and value being proposed
-        # assign each proposer to be free
-        for i in range(len(proposer_prefs)):
-            if proposer_prefs[i] != []:
-                free.append(i)
-        iteration = 0
-        while len(free) > 0:
-            iteration +=1
+        # CSR lists are expanded once, since the lists are read many times
+        if isinstance(proposer_prefs_orig, SparsePreferences):
+            proposer_prefs_orig = proposer_prefs_orig.tolist()
+        if isinstance(proposee_prefs_orig, SparsePreferences):
+            proposee_prefs_orig = proposee_prefs_orig.tolist()
+        # rank of each agent on a list, as a dict per agent
+        proposer_rank = [{agent: i for i, tier in enumerate(l) for agent in tier} for l in proposer_prefs_orig]
+        proposee_rank = [{agent: i for i, tier in enumerate(l) for agent in tier} for l in proposee_prefs_orig]
+        # number of agents left on each tier
+        proposer_left = [[len(tier) for tier in l] for l in proposer_prefs_orig]
+        proposee_left = [[len(tier) for tier in l] for l in proposee_prefs_orig]
+        head = [0] * len(proposer_prefs_orig)  # first tier of each proposer that may have agents left
+        tail = [len(l) - 1 for l in proposee_prefs_orig]  # last tier of each proposee that may have agents left
+        deleted = set()  # deleted pairs, as (proposer, proposee)
+
+        proposed = [False] * len(proposee_prefs_orig)  # whether or not a given woman has been proposed to
+        engagements = [{} for _ in proposer_prefs_orig]  # proposer as index, dict with his fiancees as keys as value
+        fiances = [{} for _ in proposee_prefs_orig]  # proposee as index, dict with her fiances as keys as value
+        free = deque(i for i in range(len(proposer_prefs_orig)) if proposer_prefs_orig[i] != [])
+        is_free = [False] * len(proposer_prefs_orig)
+        for i in free:
+            is_free[i] = True
+
+        def delete(proposer, proposee):
+            deleted.add((proposer, proposee))
+            if proposee in proposer_rank[proposer]:
+                proposer_left[proposer][proposer_rank[proposer][proposee]] -= 1
+            if proposer in proposee_rank[proposee]:
+                proposee_left[proposee][proposee_rank[proposee][proposer]] -= 1
+
+        def break_engagement(proposer, proposee):
+            del engagements[proposer][proposee]
+            del fiances[proposee][proposer]
+            if len(engagements[proposer]) == 0 and not is_free[proposer]:  # make man free if not engaged to any woman
+                is_free[proposer] = True
+                free.append(proposer)
 
-            # choose a random man
-            bended_knee = free[random.randint(0, len(free) - 1)]
-            surprised_list = proposer_prefs[bended_knee][0]
+        while len(free) > 0:
+            bended_knee = free.popleft()
+            is_free[bended_knee] = False
+            # skip the tiers with no women left
+            while head[bended_knee] < len(proposer_left[bended_knee]) and proposer_left[bended_knee][head[bended_knee]] == 0:
+                head[bended_knee] += 1
+            if head[bended_knee] == len(proposer_left[bended_knee]):  # once man's list is empty, he stays unmatched
+                continue
+
+            surprised_list = [surprised for surprised in proposer_prefs_orig[bended_knee][head[bended_knee]] if
+                              (bended_knee, surprised) not in deleted]
             for surprised in surprised_list:
-                proposed[surprised] = 1
-                # get all men less preferred than the proposer by the proposed woman
-                to_remove = []
-
-                # range from surprised's ranking of bended knee to the end of surprised's list
-                if util.find_in_list_of_lists(bended_knee, proposee_prefs[surprised]) != -1:
-                    for i in range(util.find_in_list_of_lists(bended_knee, proposee_prefs[surprised]) + 1,
-                                   len(proposee_prefs[surprised])):
-                        to_remove.append(proposee_prefs[surprised][i])
-                rejects = [item for sublist in to_remove for item in
-                           sublist]  # flatten the list of lists into a list of the men to remove
-                # remove the pairs made impossible by the current proposal
-                for reject in rejects:
-                    util.remove_from_list_of_lists(surprised, proposer_prefs[reject])
-                    util.remove_from_list_of_lists(reject, proposee_prefs[surprised])  # remove from each other's lists
-
-                    if surprised in matchings[reject]:
-                        matchings[reject].remove(surprised)
-
-                # engage_broken = [man for man in range(len(matchings)) if surprised in matchings[man]] #get all men with woman in proposed list
-                # for man in engage_broken:
-                #     matchings[man].remove(surprised) #remove the matching
-                #     if len(matchings[man]) is 0: #make man free if not engaged to any woman
-                #         free.append(man)
-
-                matchings[bended_knee].append(surprised)
-                if bended_knee in free:
-                    free.remove(bended_knee)
-            # get multiply engaged women
-            # counter = Counter(map(tuple,matchings)).items()
-            multiply_engaged = [item for item, count in Counter(x for xs in matchings for x in set(xs)).items() if
-                                count > 1]
-            # for k, v in counter:
-            #     if v > 1:
-            #         multiply_engaged = multiply_engaged + list(k)
-
-            for woman in multiply_engaged:
-                # remove engagements involving multiply engaged women
-                engage_broken = [man for man in range(len(matchings)) if
-                                 woman in matchings[man]]  # get all men with woman in proposed list
-
-                for man in engage_broken:
-
-                    matchings[man].remove(woman)  # remove the matching
-                    if len(matchings[man]) is 0:  # make man free if not engaged to any woman
-                        free.append(man)
-
-                # get men involved with multiply engaged women
-                # men_to_remove = proposee_prefs[-1][0]
-                men_to_remove = proposee_prefs[woman][-1]
-
-                for man in men_to_remove:
-                    # remove woman from man's list. Should be in top spot of man
-                    util.remove_from_list_of_lists(woman, proposer_prefs[man])
-                    # proposer_prefs[man][0].remove(woman)
-
-                # remove tail of woman's list
-                proposee_prefs[woman].pop()
-
-            # cleanup
-
-            for i in range(len(proposer_prefs)):
-                proposer_prefs[i] = [rank for rank in proposer_prefs[i] if
-                                     len(rank) > 0]  # removes any ranks with 0 women
-                if len(matchings[i]) is 0 and len(proposer_prefs[
-                                                      i]) > 0 and i not in free:  # if man has women left on list and is not engaged, add back to free
-                    free.append(i)
-                if len(proposer_prefs[i]) is 0 and i in free:  # once man's list is empty, remove from free
-                    free.remove(i)
-            for i in range(len(proposee_prefs)):
-                proposee_prefs[i] = [rank for rank in proposee_prefs[i] if
-                                     len(rank) > 0]  # removes any ranks with 0 men
-
-        matched_women = [match[0] for match in matchings if len(match) > 0]
+                proposed[surprised] = True
+                # remove the pairs made impossible by the current proposal: every man surprised ranks below bended_knee
+                if bended_knee in proposee_rank[surprised]:
+                    rank = proposee_rank[surprised][bended_knee]
+                    while tail[surprised] > rank:
+                        for reject in proposee_prefs_orig[surprised][tail[surprised]]:
+                            if (reject, surprised) not in deleted:
+                                delete(reject, surprised)
+                                if surprised in engagements[reject]:
+                                    break_engagement(reject, surprised)
+                        tail[surprised] -= 1
+                engagements[bended_knee][surprised] = None
+                fiances[surprised][bended_knee] = None
+
+            # break engagements involving women who are now multiply engaged
+            for woman in surprised_list:
+                if len(fiances[woman]) > 1:
+                    for man in list(fiances[woman]):
+                        break_engagement(man, woman)
+                    # remove the tail of the woman's list, which has the men she was engaged to
+                    while tail[woman] >= 0 and proposee_left[woman][tail[woman]] == 0:
+                        tail[woman] -= 1
+                    if tail[woman] >= 0:
+                        for man in proposee_prefs_orig[woman][tail[woman]]:
+                            if (man, woman) not in deleted:
+                                delete(man, woman)
+                        tail[woman] -= 1
+
+        proposer_prefs = [[[proposee for proposee in tier if (proposer, proposee) not in deleted] for tier in l]
+                          for proposer, l in enumerate(proposer_prefs_orig)]
+        proposer_prefs = [[tier for tier in l if len(tier) > 0] for l in proposer_prefs]  # removes any ranks with 0 women
+        proposee_prefs = [[[proposer for proposer in tier if (proposer, proposee) not in deleted] for tier in l]
+                          for proposee, l in enumerate(proposee_prefs_orig)]
+        proposee_prefs = [[tier for tier in l if len(tier) > 0] for l in proposee_prefs]  # removes any ranks with 0 men
+
+        matched_women = set(next(iter(engaged)) for engaged in engagements if len(engaged) > 0)
         unmatched_women = [woman for woman in range(len(proposee_prefs_orig)) if woman not in matched_women]
-        unmatched_men = [man for man in range(len(matchings)) if len(matchings[man]) == 0]
+        unmatched_men = [man for man in range(len(engagements)) if len(engagements[man]) == 0]
 
         for woman in unmatched_women:
-            if proposed[woman] > 0:
+            if proposed[woman]:
                 return None, None, None, None  # no SSM exists
 
         return proposer_prefs, proposee_prefs, unmatched_men, unmatched_women
 
+    def get_gendered_GS_list_by_rounds(self, proposer_prefs_orig, proposee_prefs_orig, proposer_rank, proposee_rank):
+        """Runs a round-synchronous version of SUPER2 from Manlove. In each round every free proposer proposes to his
+        whole head tier at once, then every proposee rejects the proposers she ranks below her best proposal, and then
+        every multiply engaged proposee breaks her engagements and deletes the tail of her list. Each round is a few
+        NumPy operations over arrays with one entry per pair on the proposers' lists, so nothing is n by n even for
+        sparse or banded instances, and there are far fewer rounds than proposals when ties are long.
+        Gives the same lists as get_gendered_GS_list_incomplete_prefs, for lists where a pair is on both agents' lists
+        or on neither.
+
+        Parameters
+        ----------
+        proposer_prefs_orig : list
+            The preferences for the proposing side of the algorithm.
+            List of lists, where each sublist is the preferences for one agent. The sublist is a list of lists as well.
+        proposee_prefs_orig : list
+            The preferences for the non-proposing side of the algorithm.
+            List of lists, where each sublist is the preferences for one agent. The sublist is a list of lists as well.
+        proposer_rank : np.ndarray, BandedRankMatrix or SparseRankMatrix
+            Rank matrix of the proposer prefs. See util.get_rank_matrix.
+        proposee_rank : np.ndarray, BandedRankMatrix or SparseRankMatrix
+            Rank matrix of the proposee prefs.
+
+        Returns
+        -------
+        list x4
+            The proposer-optimal GS list of the proposer prefs, the proposer-optimal GS list of the proposee prefs, the
+            unmatched proposers and the unmatched proposees. All None if there is no super-stable matching.
+        """
+        num_proposers = len(proposer_prefs_orig)
+        num_proposees = len(proposee_prefs_orig)
+        # every pair on a proposer's list, with both agents' ranks of it
+        if not isinstance(proposer_prefs_orig, SparsePreferences):
+            proposer_prefs_orig = SparsePreferences(proposer_prefs_orig)
+        proposers, proposees = proposer_prefs_orig.pairs()
+        on_list = proposees < num_proposees
+        proposers, proposees = proposers[on_list], proposees[on_list]
+        ranks = np.asarray(proposer_rank[proposers, proposees], dtype=np.int64)
+        ranks_by_proposee = np.asarray(proposee_rank[proposees, proposers], dtype=np.int64)
+        unranked = max(ranks.max(initial=0), ranks_by_proposee.max(initial=0)) + 1
+
+        alive = (ranks >= 0) & (ranks_by_proposee >= 0)  # pairs that haven't been deleted
+        engaged = np.zeros(len(ranks), dtype=bool)
+        proposed = np.zeros(num_proposees, dtype=bool)
+        while True:
+            free = ((np.bincount(proposers[engaged], minlength=num_proposers) == 0)
+                    & (np.bincount(proposers[alive], minlength=num_proposers) > 0))
+            if not free.any():
+                break
+
+            # every free proposer proposes to his whole head tier
+            head = np.full(num_proposers, unranked)
+            np.minimum.at(head, proposers[alive], ranks[alive])
+            proposals = alive & free[proposers] & (ranks == head[proposers])
+            proposed[proposees[proposals]] = True
+
+            # each proposee rejects everyone she ranks below her best proposal
+            best = np.full(num_proposees, unranked)
+            np.minimum.at(best, proposees[proposals], ranks_by_proposee[proposals])
+            rejected = alive & (ranks_by_proposee > best[proposees])
+            alive &= ~rejected
+            engaged &= alive
+            engaged |= proposals & alive
+
+            # multiply engaged proposees break their engagements and delete the tail of their lists
+            multiple = np.bincount(proposees[engaged], minlength=num_proposees) > 1
+            if multiple.any():
+                engaged &= ~multiple[proposees]
+                tail = np.full(num_proposees, -1)
+                np.maximum.at(tail, proposees[alive], ranks_by_proposee[alive])
+                alive &= ~(multiple[proposees] & (ranks_by_proposee == tail[proposees]))
+
+        if (np.bincount(proposers[engaged], minlength=num_proposers) > 1).any():
+            return None, None, None, None  # a proposer is engaged to several proposees, so no SSM exists
+        matched_proposees = np.bincount(proposees[engaged], minlength=num_proposees) > 0
+        if (proposed & ~matched_proposees).any():
+            return None, None, None, None  # no SSM exists
+
+        alive_pairs = set(zip(proposers[alive].tolist(), proposees[alive].tolist()))
+        proposer_prefs = [[[proposee for proposee in tier if (proposer, proposee) in alive_pairs] for tier in l]
+                          for proposer, l in enumerate(proposer_prefs_orig)]
+        proposer_prefs = [[tier for tier in l if len(tier) > 0] for l in proposer_prefs]
+        proposee_prefs = [[[proposer for proposer in tier if (proposer, proposee) in alive_pairs] for tier in l]
+                          for proposee, l in enumerate(proposee_prefs_orig)]
+        proposee_prefs = [[tier for tier in l if len(tier) > 0] for l in proposee_prefs]
+        unmatched_men = np.flatnonzero(np.bincount(proposers[engaged], minlength=num_proposers) == 0).tolist()
+        unmatched_women = np.flatnonzero(~matched_proposees).tolist()
+
+        return proposer_prefs, proposee_prefs, unmatched_men, unmatched_women
+
     def make_Gd(self, edges, M):
-        """Gets and prints the spreadsheet's header columns
+        """Creates Gd, a graph used in the algorithm in set_all_rotations.
 
         Parameters
         ----------
         edges : list
-            list of tuples. Each tuple is a pair of strings representing the man and woman who the edge connects.
+            list of tuples. Each tuple is a pair of ints, the man and woman who the edge connects.
         M : list
             List representing the man optimal matching. Index is the man, value the woman he's paired with.
 
         Returns
         -------
-        Digraph
+        CondensedDigraph
             Gd
         """
-        Gd = self.initialize_digraph2()
+        Gd = self.initialize_digraph2(condensed=True)
 
-        for edge in edges:
-            if M[int(edge[0][1:])] == int(edge[1][1:]):  # if edge is a match in M
-                Gd.addDirectedEdge(edge[1], edge[0])
+        for man, woman in edges:
+            if M[man] == woman:  # if edge is a match in M
+                Gd.addDirectedEdge(Gd.woman(woman), man)
             else:
-                Gd.addDirectedEdge(edge[0], edge[1])
+                Gd.addDirectedEdge(man, Gd.woman(woman))
 
-        # self.add_directed_edges(Gd, woman_to_man, False)
         return Gd
 
-    def set_all_rotations(self):
+    def set_all_rotations(self, decompose=False, processes=1, kernelize=False, fast_path=True):
         """Runs the algorithm to find all the rotations in a super-stable matching instance.
         Sets the instances rotations attribute to the list of rotations.
 
         Parameters
         ----------
-        None
+        decompose : bool
+            If True, the rotations of every block (see get_blocks) are found separately, on an instance with only the
+            block's agents. Every rotation moves men along their GS-lists, so it lies within one block, and rotations of
+            different blocks are incomparable. The rotations are the same, but listed block by block.
+        processes : int
+            Number of processes to solve the blocks with, if decompose is True.
+        kernelize : bool
+            If True, the agents with the same partner in every super stable matching (see get_kernel) are removed first
+            and the rotations are found on an instance with only the remaining ones, then mapped back. Combined with
+            decompose, the blocks are those of that smaller instance.
+        fast_path : bool
+            If True and neither side's preferences have ties, the instance is a stable marriage instance and the
+            rotations are found by set_all_rotations_strict instead, which lists the same rotations in the same order and
+            form. With False, the general algorithm is always used.
 
         Returns
         -------
@@ -633,341 +2055,679 @@ class SuperStableMatchingInstance:
         """
         if not hasattr(self, 'man_optimal_SM'):
             return [], []
+        if kernelize:
+            men, women = self.get_kernel()
+            kernel = self.get_sub_instance(men, women)
+            kernel.set_all_rotations(decompose, processes, fast_path=fast_path and not self.has_ties())
+            self.rotations = []
+            self.cycle_starts = []
+            for rotation, cycle_indices in zip(kernel.rotations, kernel.cycle_starts):
+                rotation, cycle_indices = self.get_original_rotation(rotation, cycle_indices, men, women)
+                self.rotations.append(rotation)
+                self.cycle_starts.append(cycle_indices)
+            return
+        if decompose:
+            self.set_all_rotations_by_blocks(processes, fast_path)
+            return
+        if fast_path and not self.has_ties():
+            self.set_all_rotations_strict()
+            return
 
-        # M0 = self.initialize_digraph(self.man_optimal_SM, True, True)
         M0 = self.man_optimal_SM
         Mz = self.woman_optimal_SM
-        # M0.addNodes(range(len(self.man_optimal_SM))) #self.man_optimal_SM
-        # Mz = self.initialize_digraph(self.woman_optimal_SM, True, True) # need to use man preference lists?
-        M = deepcopy(M0)
-        matchings = []
+        M = list(M0)
+        M_inv = self.get_partners(M)  # inverse of M, index is the woman, value the man she's paired with
         rotations = []
-        # matchings.append(deepcopy(M))
+        man_ranks = self.man_GSlist_rank.tolist()
+        woman_ranks = self.woman_GSlist_rank.tolist()
+
         # M_prime has all man to woman edges in M not in Mz
         M_prime = []
         for man, woman in enumerate(self.man_optimal_SM):
-            if self.woman_optimal_SM[man] is woman and woman is not -1:
-                M_prime.append([man, woman])
+            if self.woman_optimal_SM[man] == woman and woman != -1:
+                M_prime.append((man, woman))
 
         # E is the list of all edges, in form of man, woman
         E = []
-        edge_ranks = {}  # edge_ranks is a dict with edge as key, (man's rank of woman, woman's rank of man) as value
-
         for man, l in enumerate(self.male_prefs_GSlist): # TODO: Prove GS-List edges are okay here?
             for rank in l:
                 for woman in rank:
-                    edge = ('m' + str(man), 'w' + str(woman))
-                    E.append(edge)
-                    edge_ranks[edge] = (util.find_in_list_of_lists(woman, self.male_prefs_GSlist[man]),
-                                        util.find_in_list_of_lists(man, self.female_prefs_GSlist[woman]))
+                    E.append((man, woman))
 
         Ed = []
         for i in range(len(M)):
             if M[i]!= -1:
-                Ed.append(('m' + str(i), 'w' + str(M[i])))
+                Ed.append((i, M[i]))
         Gd = self.make_Gd(Ed, M)
-        E_prime = [edge for edge in E if edge not in Ed]
-
-        Ec = deepcopy(M_prime)
+        Ed = set(Ed)
+        # E' is indexed by man and woman and bucketed by rank, and keeps the order of E
+        E_prime = CandidateEdges((edge for edge in E if edge not in Ed), man_ranks, woman_ranks,
+                                 [len(l) for l in self.male_prefs_GSlist], [len(l) for l in self.female_prefs_GSlist])
 
+        # Ec is a dict with the edges as keys as well. Its edges are exactly the edges of Gc
+        Ec = dict.fromkeys(M_prime)
         Gc = self.initialize_digraph2()
-        self.add_directed_edges(Gc, Ec, True)
-        Ec = list(Gc.digraph.edges)  # format Ec properly
+        for man, woman in Ec:
+            Gc.addDirectedEdge(man, Gc.woman(woman))
 
         while (M != Mz):  # while the current matching is not the woman optimal
 
             # remove irrelevant edges
-            self.remove_dominated_nonblocking_edges(M, E_prime)
+            self.remove_dominated_nonblocking_edges(M, M_inv, E_prime)
 
-            zerodeg_men = [node for node in Gc.digraph if Gc.digraph.degree(node) == 0 and node[0] is 'm']
+            zerodeg_men = [node for node in Gc if Gc.degree(node) == 0 and Gc.isMan(node)]
 
             while (len(zerodeg_men) > 0):
                 validManExists = False
 
                 # search for a man with zero edges in Gc and strongly connected component with 0 outdegree
                 for man in zerodeg_men:
-                    # component containing man
-                    component = [c for c in list(nx.strongly_connected_components(Gd.digraph)) if man in c][0]
-                    if util.get_outdegree_of_component(Gd, component) == 0:
+                    if Gd.inSinkComponent(man):
                         m = man
                         validManExists = True
                         break
 
                 if not validManExists:  # if no man fulfilling condition exists, break loop
                     break
-                lowest_rank = 99999999999
-                m_edges = []
-                for edge in E_prime:
-                    if edge[0] == m:  # if edge contains m
-                        m_edges.append(edge)
-                        lowest_rank = min(lowest_rank, edge_ranks[edge][0])
-
-                m_best_edges = [edge for edge in m_edges if edge_ranks[edge][0] is lowest_rank]
-
-                for edge in m_best_edges:
-                    Ed.append(edge)
-                    Gd.addDirectedEdge(edge[0], edge[1])
+                m_best_edges = E_prime.best(m)
 
-                # component containing m
-                component = [c for c in list(nx.strongly_connected_components(Gd.digraph)) if m in c][0]
+                for man, woman in m_best_edges:
+                    Gd.addDirectedEdge(man, Gd.woman(woman))
 
-                if util.get_outdegree_of_component(Gd, component) == 0:
+                # if the component containing m has 0 outdegree
+                if Gd.inSinkComponent(m):
                     for edge in m_best_edges:
-                        w_partner_edge = (
-                        'm' + str(M.index(int(edge[1][1:]))), edge[1])  # edge between w and her current partner
-                        m_partner_edge = (
-                        edge[0], 'w' + str(M[int(edge[0][1:])]))  # edge between w and her current partner
-                        if edge_ranks[edge][1] < edge_ranks[w_partner_edge][1] and edge_ranks[edge][0] > \
-                                edge_ranks[m_partner_edge][0]  \
-                                :  # if the woman prefers this edge to her current partner and the man prefers his current partner to this edge, add to Ec
+                        man, woman = edge
+                        w_partner = M_inv[woman]  # woman's current partner
+                        # if the woman prefers this edge to her current partner and the man prefers his current partner to this edge, add to Ec
+                        if woman_ranks[woman][man] < woman_ranks[woman][w_partner] and man_ranks[man][woman] > \
+                                man_ranks[man][M[man]]:
 
-                            current_Gc_edges = Gc.digraph.in_edges('w' + edge[1][1:])
+                            current_Gc_partners = list(Gc.pred.get(Gc.woman(woman), ()))
 
                             #if the woman either has no edges in Gc or prefers the new edge to the one(s) she has in Gc
                             # note if she has multiple edges in Gc, she must be indifferent towards them
-                            if len(current_Gc_edges)==0 or edge_ranks[list(current_Gc_edges)[0]][1] > edge_ranks[edge][1]:
-                                Ec.append(edge)
-                                Gc.addDirectedEdge(edge[0], edge[1])
+                            if len(current_Gc_partners) == 0 or woman_ranks[woman][current_Gc_partners[0]] > woman_ranks[woman][man]:
+                                Ec[edge] = None
+                                Gc.addDirectedEdge(man, Gc.woman(woman))
 
                                 # remove any edges dominated by new edge
-                                toremove = []
-                                for edge2 in Ec:
-                                    if edge2[1] == edge[1] and edge_ranks[edge2][1] > edge_ranks[edge][1]:
-                                        toremove.append(edge2)
-                                for goner in toremove:
-                                    Ec.remove(goner)
-                                    Gc.digraph.remove_edge(goner[0], goner[1])
+                                for man2 in current_Gc_partners:
+                                    if woman_ranks[woman][man2] > woman_ranks[woman][man]:
+                                        del Ec[(man2, woman)]
+                                        Gc.removeDirectedEdge(man2, Gc.woman(woman))
                         E_prime.remove(edge)
-                zerodeg_men = [node for node in Gc.digraph if Gc.digraph.degree(node) == 0 and node[
-                    0] is 'm']  # since edges can be removed from Ed in this loop, must be recalculated
+                zerodeg_men = [node for node in Gc if Gc.degree(node) == 0 and Gc.isMan(node)]  # since edges can be removed from Ed in this loop, must be recalculated
 
             # delete lowest ranked edges incident to women that are multiply engaged
-            self.delete_multiple_engagement_edges(E_prime, Gc, Ec, Gd, edge_ranks)
-
-            components = list(nx.strongly_connected_components(Gd.digraph))
-            valid_components = [c for c in components if util.get_outdegree_of_component(Gd, c) == 0]
-            while (len(valid_components) > 0):  # while a rotation is exposed
-                isMatching = False
-                for component in valid_components:  # iterate over components until perfect matching found
-                    rotation_subgraph = Gc.digraph.subgraph(component).copy()
-                    if nx.is_perfect_matching(rotation_subgraph, rotation_subgraph.edges):
-                        isMatching = True
-                        break
-                if not isMatching:
-                    break
+            self.delete_multiple_engagement_edges(E_prime, Gc, Ec, Gd)
+
+            rotation_subgraph = self.get_exposed_rotation(Gd, Gc)
+            while (rotation_subgraph is not None):  # while a rotation is exposed
 
                 # get rotation in [man, woman] pair form with man and woman being the pre rotation match
-                matchings.append(deepcopy(M))
-                rotation, M, starts = self.eliminate_rotation_by_graph(deepcopy(rotation_subgraph), M)
+                rotation, M, starts = self.eliminate_rotation_by_graph(rotation_subgraph, M, M_inv)
+                for man, woman in rotation_subgraph.items():
+                    M_inv[woman] = man
                 self.cycle_starts.append(starts)
                 rotations.append(rotation)
 
                 # update Gc
-                toremove = []
-                for edge in Ec:
+                for man, woman in rotation_subgraph.items():
+                    # if the man's partner in current matching equals man's partner in woman optimal and edge connects partners, edge remains in Ec
+                    if M[man] != Mz[man] or M[man] != woman:
+                        del Ec[(man, woman)]
+                        Gc.removeDirectedEdge(man, Gc.woman(woman))
 
-                    if edge in rotation_subgraph.edges:  # both ends of edge must be in strongly connected component. TODO: comment this if out even though it's in the algorithm?
-                        if M[int(edge[0][1:])] != Mz[int(edge[0][1:])] or M[int(edge[0][1:])] != int(edge[1][
-                                                                                                      1:]):  # if the man's partner in current matching equals man's partner in woman optimal and edge connects partners, edge remains in Ec
-                            toremove.append(edge)
-                for goner in toremove:
-                    Ec.remove(goner)
-                    Gc.digraph.remove_edge(goner[0], goner[1])
                 # update Gd
+                rotation_nodes = set(rotation_subgraph)
+                rotation_nodes.update(Gd.woman(woman) for woman in rotation_subgraph.values())
                 toremove = []  # Gd needs directions fixed
                 toadd = []  # reversed edges to be added
-                for edge in Gd.digraph.edges:
-                    if edge[0] not in rotation_subgraph.nodes and edge[1] not in rotation_subgraph.nodes:
-                        continue
-                    if edge[0][0] == 'm':  # if necessary since graph is directed
-
-                        edgeman = int(edge[0][1:])
-                        edgewoman = int(edge[1][1:])
-                        if not M[edgeman] == edgewoman:
-                            toremove.append(edge)
-                        else:  # if the man to woman edge qualifies to stay, add the reverse edge and remove
-                            toadd.append(edge)
-                            toremove.append(edge)
-
-                    else:
-                        edgeman = int(edge[1][1:])
-                        edgewoman = int(edge[0][1:])
-                        if not M[edgeman] == edgewoman:
-                            toremove.append((edge[1], edge[0]))
+                # visit the edges touching the rotation in the order Gd stores them
+                sources = set(rotation_nodes)
+                for node in rotation_nodes:
+                    sources.update(Gd.pred[node])
+                for source in sorted(sources, key=Gd.position.__getitem__):
+                    for target in Gd.succ[source]:
+                        if source not in rotation_nodes and target not in rotation_nodes:
+                            continue
+                        if Gd.isMan(source):  # if necessary since graph is directed
+                            if not M[source] == target - Gd.num_men:
+                                toremove.append((source, target))
+                            else:  # if the man to woman edge qualifies to stay, add the reverse edge and remove
+                                toadd.append((source, target))
+                                toremove.append((source, target))
+                        elif not M[target] == source - Gd.num_men:
+                            toremove.append((source, target))
 
                 for goner in toremove:
-                    Ed.remove(goner)
-                    if goner in Gd.digraph.edges:
-                        Gd.digraph.remove_edge(goner[0], goner[1])
-                    else:
-                        Gd.digraph.remove_edge(goner[1], goner[0])
+                    Gd.removeDirectedEdge(goner[0], goner[1])
                 for new in toadd:
-                    Ed.append(new)
                     Gd.addDirectedEdge(new[1], new[0])
 
-                # update components list to see if other rotations are exposed
-                components = list(nx.strongly_connected_components(Gd.digraph))
-                valid_components = [c for c in components if util.get_outdegree_of_component(Gd, c) == 0]
+                # see if other rotations are exposed
+                rotation_subgraph = self.get_exposed_rotation(Gd, Gc)
+
+        self.rotations = rotations
+
+    def set_all_rotations_by_blocks(self, processes=1, fast_path=True):
+        """Finds the rotations of every block separately and combines them. Blocks where every man has the same partner
+        in the man and woman optimal matchings have no rotations and are skipped.
+
+        Parameters
+        ----------
+        processes : int
+            Number of processes to solve the blocks with. With 1, they are solved one after the other.
+        fast_path : bool
+            If True and the instance has no ties, the blocks are solved with set_all_rotations_strict.
+
+        Returns
+        -------
+        None
+        """
+        blocks = [(men, women) for men, women in self.blocks
+                  if any(self.man_optimal_SM[man] != self.woman_optimal_SM[man] for man in men)]
+        block_instances = [self.get_sub_instance(men, women) for men, women in blocks]
+        fast_path = fast_path and not self.has_ties()
+        if processes > 1 and len(block_instances) > 1:
+            with Pool(min(processes, len(block_instances))) as p:
+                results = p.starmap(get_block_rotations, [(block, fast_path) for block in block_instances])
+        else:
+            results = [get_block_rotations(block, fast_path) for block in block_instances]
+
+        self.rotations = []
+        self.cycle_starts = []
+        for (men, women), (rotations, cycle_starts) in zip(blocks, results):
+            for rotation, cycle_indices in zip(rotations, cycle_starts):
+                rotation, cycle_indices = self.get_original_rotation(rotation, cycle_indices, men, women)
+                self.rotations.append(rotation)
+                self.cycle_starts.append(cycle_indices)
+
+    def has_ties(self):
+        """Checks whether any man or woman is indifferent between two agents on their preference list.
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        bool
+            True if some tier of a preference list has more than one agent.
+        """
+        for prefs in (self.male_prefs, self.female_prefs):
+            if isinstance(prefs, SparsePreferences):
+                if np.any(np.diff(prefs.tier_ptr) > 1):
+                    return True
+            elif any(len(tier) > 1 for l in prefs for tier in l):
+                return True
+        return False
+
+    def set_all_rotations_strict(self):
+        """Finds all the rotations of an instance without ties, where super stable matchings are stable matchings, with
+        the minimal differences algorithm of Gusfield and Irving. In a matching M, s(m) is the first woman after M(m) on
+        m's reduced GS-list who prefers m to her partner, and next(m) her partner. The rotations exposed in M are the
+        cycles of next, so every round all of them are eliminated at once, and the rotations they expose are found in
+        the next round. Since women only get better partners, an entry of a man's list that was skipped stays skipped,
+        so every list is scanned once.
+
+        Rotations are listed in the same order and form as set_all_rotations would. That algorithm finds the rotations
+        exposed in the same rounds, and within a round the one its digraph Gd leads to first, where Gd has an edge from
+        every man to s(m) and from every woman to her partner: they are sorted by the first node of Gd, in the order
+        Gd adds them, whose path leads into them. Rotations are put in form by get_canonical_rotation.
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        None
+        """
+        M = list(self.man_optimal_SM)
+        Mz = self.woman_optimal_SM
+        M_inv = self.get_partners(M)
+        woman_ranks = self.woman_GSlist_rank.tolist()
+        lists = [[tier[0] for tier in l] for l in self.male_prefs_GSlist]
+        num_men = len(lists)
+        position = [0] * num_men  # index of M[m] in m's list
+        scanned = [0] * num_men  # index of s(m) in m's list
+
+        def get_next(man):
+            i = max(scanned[man], position[man] + 1)
+            while woman_ranks[lists[man][i]][man] > woman_ranks[lists[man][i]][M_inv[lists[man][i]]]:
+                i += 1
+            scanned[man] = i
+            return lists[man][i]
+
+        # nodes of Gd in the order initialize_digraph2 and make_Gd add them, men as themselves and women after the men
+        nodes = {}
+        for man, woman in enumerate(M):
+            if woman != -1:
+                nodes.setdefault(man, len(nodes))
+                nodes.setdefault(num_men + man, len(nodes))
+        for man, woman in enumerate(M):
+            if woman != -1:
+                nodes.setdefault(num_men + woman, len(nodes))
 
-        # add woman-optimal matching
-        matchings.append(M)
-        # self.matchings = matchings
+        rotations = []
+        while M != Mz:
+            s = {man: get_next(man) for man in range(num_men) if M[man] != Mz[man]}
+
+            # the exposed rotations are the cycles of next, the nodes of Gd in them are labelled by rotation
+            label = {}
+            exposed = []
+            visited = set()
+            for start in s:
+                path = []
+                man = start
+                while man in s and man not in visited:
+                    visited.add(man)
+                    path.append(man)
+                    man = M_inv[s[man]]
+                if man in path:
+                    men = path[path.index(man):]
+                    for m in men:
+                        label[m] = label[num_men + M[m]] = len(exposed)
+                    exposed.append(men)
+
+            # follow Gd from every node in order, a rotation is found when a path first leads into it
+            order = []
+            found = [False] * len(exposed)
+            for node in nodes:
+                path = []
+                while node is not None and node not in label:
+                    path.append(node)
+                    if node < num_men:
+                        node = num_men + s[node] if node in s else None
+                    else:
+                        node = M_inv[node - num_men] if M_inv[node - num_men] != -1 else None
+                target = label.get(node, -1)
+                for n in path:
+                    label[n] = target
+                if target != -1 and not found[target]:
+                    found[target] = True
+                    order.append(target)
+
+            for i in order:
+                rotation, cycle_indices = self.get_canonical_rotation([[[man, M[man]] for man in exposed[i]]])
+                rotations.append(rotation)
+                self.cycle_starts.append(cycle_indices)
+            for men in exposed:
+                for man in men:
+                    position[man] = scanned[man]
+                    M[man] = s[man]
+                    M_inv[s[man]] = man
         self.rotations = rotations
-        # return rotations
+
+    def get_blocks(self):
+        """Gets the connected components of the bipartite graph with an edge for every pair in the reduced GS-lists.
+        Super stable matchings only pair agents on each other's GS-lists, so each component can be solved as an
+        instance of its own, and the matchings of the instance are the combinations of the matchings of the blocks.
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        list
+            List of (men, women) pairs of sorted lists, one per component with at least one pair, ordered by their
+            lowest numbered man.
+        """
+        blocks = []
+        seen = [False] * len(self.male_prefs_GSlist)
+        seen_women = [False] * len(self.female_prefs_GSlist)
+        for start in range(len(self.male_prefs_GSlist)):
+            if seen[start] or len(self.male_prefs_GSlist[start]) == 0:
+                continue
+            seen[start] = True
+            men, women = [start], []
+            stack = [start]
+            while stack:
+                man = stack.pop()
+                for tier in self.male_prefs_GSlist[man]:
+                    for woman in tier:
+                        if seen_women[woman]:
+                            continue
+                        seen_women[woman] = True
+                        women.append(woman)
+                        for man_tier in self.female_prefs_GSlist[woman]:
+                            for man2 in man_tier:
+                                if not seen[man2]:
+                                    seen[man2] = True
+                                    men.append(man2)
+                                    stack.append(man2)
+            blocks.append((sorted(men), sorted(women)))
+        return blocks
+
+    def get_kernel(self):
+        """Gets the men whose partners in the man and woman optimal matchings differ, and their partners. Every other
+        man, including those whose reduced GS-list has a single entry, has the same partner in every super stable
+        matching and takes part in no rotation, so the rotations can be found without them and their partners.
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        list x2
+            The sorted men and the sorted women left.
+        """
+        men = [man for man in range(len(self.man_optimal_SM)) if self.man_optimal_SM[man] != self.woman_optimal_SM[man]]
+        women = sorted(self.man_optimal_SM[man] for man in men)
+        return men, women
+
+    def get_sub_instance(self, men, women):
+        """Creates the instance restricted to some men and women, such as a block or the kernel, relabelled from 0 in
+        order and with the reduced GS-lists as preferences. Other agents are dropped from the GS-lists. SUPER isn't run
+        again, the GS-lists and extreme matchings are restricted from this instance.
+
+        Parameters
+        ----------
+        men : list
+            Sorted men to keep.
+        women : list
+            Sorted women to keep. Must include the partners of the men in the extreme matchings.
+
+        Returns
+        -------
+        SuperStableMatchingInstance
+            The restricted instance, ready for set_all_rotations.
+        """
+        man_label = {man: i for i, man in enumerate(men)}
+        woman_label = {woman: i for i, woman in enumerate(women)}
+        woman_label[-1] = -1
+        sub = SuperStableMatchingInstance.__new__(SuperStableMatchingInstance)
+        sub.matchings = []
+        sub.rotations = []
+        sub.cycle_starts = []
+        sub.rotation_digraph_edges = []
+        sub.male_prefs_GSlist = [[[woman_label[woman] for woman in tier if woman in woman_label]
+                                  for tier in self.male_prefs_GSlist[man]] for man in men]
+        sub.female_prefs_GSlist = [[[man_label[man] for man in tier if man in man_label]
+                                    for tier in self.female_prefs_GSlist[woman]] for woman in women]
+        sub.male_prefs_GSlist = [[tier for tier in l if len(tier) > 0] for l in sub.male_prefs_GSlist]
+        sub.female_prefs_GSlist = [[tier for tier in l if len(tier) > 0] for l in sub.female_prefs_GSlist]
+        sub.male_prefs = sub.male_prefs_GSlist
+        sub.female_prefs = sub.female_prefs_GSlist
+        sub.num_men = len(men)
+        sub.num_women = len(women)
+        sub.banded = self.banded
+        sub.sparse = self.sparse
+        sub.man_rank = sub.man_GSlist_rank = sub.get_rank_matrix(sub.male_prefs_GSlist, sub.num_women)
+        sub.woman_rank = sub.woman_GSlist_rank = sub.get_rank_matrix(sub.female_prefs_GSlist, sub.num_men)
+        sub.man_optimal_SM = [woman_label[self.man_optimal_SM[man]] for man in men]
+        sub.woman_optimal_SM = [woman_label[self.woman_optimal_SM[man]] for man in men]
+        sub.unmatched_men = [man_label[man] for man in self.unmatched_men if man in man_label]
+        sub.unmatched_women = [woman_label[woman] for woman in self.unmatched_women if woman in woman_label]
+        sub.blocks = sub.get_blocks()
+        return sub
+
+    def get_original_rotation(self, rotation, cycle_indices, men, women):
+        """Maps a rotation of a restricted instance (see get_sub_instance) back to the labels of the instance, in the form
+        given by get_canonical_rotation, so the rotation is the same as the one found on the whole instance.
+
+        Parameters
+        ----------
+        rotation : list
+            The rotation in the labels of the restricted instance, as [man, woman] pairs.
+        cycle_indices : list
+            Indices in the rotation where its cycles start.
+        men : list
+            Sorted men of the restricted instance, men[i] is its man i.
+        women : list
+            Sorted women of the restricted instance.
+
+        Returns
+        -------
+        list x2
+            The rotation in the labels of the instance, and the indices where its cycles start.
+        """
+        cycles = []
+        for start, end in zip(cycle_indices, list(cycle_indices[1:]) + [len(rotation)]):
+            cycles.append([[men[man], women[woman]] for man, woman in rotation[start:end]])
+        return self.get_canonical_rotation(cycles)
+
+    @staticmethod
+    def get_canonical_rotation(cycles):
+        """Puts a rotation in the form every method that finds rotations lists it in: each cycle starts from its lowest
+        numbered man, and the cycles are sorted by that man.
+
+        Parameters
+        ----------
+        cycles : list
+            The cycles of the rotation, each a list of [man, woman] pairs in the order of the cycle, from any man.
+
+        Returns
+        -------
+        list x2
+            The rotation as [man, woman] pairs, and the indices where its cycles start.
+        """
+        rotation = []
+        cycle_starts = []
+        for cycle in sorted(cycles, key=lambda cycle: min(man for man, _ in cycle)):
+            first = min(range(len(cycle)), key=lambda i: cycle[i][0])
+            cycle_starts.append(len(rotation))
+            rotation.extend(cycle[first:] + cycle[:first])
+        return rotation, cycle_starts
+
+    def get_partners(self, M):
+        """Inverts a matching.
+
+        Parameters
+        ----------
+        M : list
+            The matching. Index is the man, value the woman he's paired with, -1 if unmatched.
+
+        Returns
+        -------
+        list
+            Index is the woman, value the man she's paired with, -1 if unmatched.
+        """
+        M_inv = [-1] * self.num_women
+        for man, woman in enumerate(M):
+            if woman != -1:
+                M_inv[woman] = man
+        return M_inv
+
+    def get_exposed_rotation(self, Gd, Gc):
+        """Finds a rotation exposed in the current matching: a component of Gd with outdegree 0 in which the edges of
+        Gc form a perfect matching. If there are several, returns the one in the component networkx's
+        strongly_connected_components would list first, so rotations are found in the same order as before.
+
+        Parameters
+        ----------
+        Gd : CondensedDigraph
+            The digraph of current relevant edges.
+        Gc : CompactDigraph
+            The digraph of candidate edges.
+
+        Returns
+        -------
+        dict
+            The edges of Gc in the rotation, man as key and woman as value. None if no rotation is exposed.
+        """
+        components = []
+        rotation_subgraphs = []
+        for component in Gd.sinkComponents():
+            rotation_subgraph = self.get_perfect_matching(Gc, component)
+            if rotation_subgraph is not None:
+                components.append(component)
+                rotation_subgraphs.append(rotation_subgraph)
+        if len(components) == 0:
+            return None
+        if len(components) == 1:
+            return rotation_subgraphs[0]
+        return rotation_subgraphs[Gd.firstEntered(components)]
+
+    def get_perfect_matching(self, Gc, component):
+        """Checks whether the edges of Gc within a component of Gd form a perfect matching of the component's nodes that
+        are in Gc, in which case they form a rotation.
+
+        Parameters
+        ----------
+        Gc : CompactDigraph
+            The digraph of candidate edges.
+        component : set
+            Nodes of the component of Gd.
+
+        Returns
+        -------
+        dict
+            The edges of the perfect matching, man as key and woman as value. None if the edges aren't a perfect matching.
+        """
+        nodes = [node for node in component if node in Gc]
+        matching = {}
+        covered = set()
+        for node in nodes:
+            for target in Gc.succ[node]:
+                if target not in component:
+                    continue
+                if node in covered or target in covered:
+                    return None
+                covered.update((node, target))
+                matching[node] = target - Gc.num_men
+        if len(covered) != len(nodes):
+            return None
+        return matching
 
     #
-    def eliminate_rotation_by_graph(self, rotation_subgraph, M):
+    def eliminate_rotation_by_graph(self, rotation_subgraph, M, M_inv):
         """transforms directed edges representing a cycle into a rotation represented by current pairings, updates matching
 
         Parameters
         ----------
+        rotation_subgraph : dict
+            The edges of Gc included in the rotation, man as key and the woman his edge goes to as value.
         M : list
             The current matching.
-        rotation_subgraph : networkx.DiGraph
-            The graph of nodes and edges included in the rotation.
+        M_inv : list
+            The inverse of the current matching, index is the woman, value her partner.
 
         Returns
         -------
         list x3
             list representing the rotation, list representing the new matching, list of indices representing where the cycles begin in the rotation
         """
-        rotation = []
-        new_M = deepcopy(M)
-
-        j = 0
-        # get the lowest numbered man in the rotation who is still with his old partner
-        cycle_starts = []
-        while len(rotation_subgraph.edges) >0:
-            edge = min(rotation_subgraph.edges, key=lambda x: x[0])
-            first_man = int(edge[0][1:])
-            cycle_starts.append(j)
-            rotation.append([first_man, M[first_man]])
-            j+=1
+        cycles = []
+        new_M = list(M)
+        remaining = dict(rotation_subgraph)
+
+        while len(remaining) > 0:
+            # follow a cycle from the lowest numbered man in the rotation who is still with his old partner
+            first_man = min(remaining)
+            cycle = [[first_man, M[first_man]]]
+            cycles.append(cycle)
             # next woman in rotation
-            next = int(list(rotation_subgraph.out_edges("m" + str(first_man)))[0][1][1:])
-            rotation_subgraph.remove_edge(edge[0], edge[1])
+            next = remaining.pop(first_man)
 
             # partner of next woman in rotation
             new_M[first_man] = next
 
-            current_man = M.index(next)
+            current_man = M_inv[next]
             # update the matching
 
             while current_man != first_man:
-                rotation.append([current_man, next])
-                j+=1
-                edge = list(rotation_subgraph.out_edges("m" + str(current_man)))[0]
-                next = int(edge[1][1:])
+                cycle.append([current_man, next])
+                next = remaining.pop(current_man)
 
                 new_M[current_man] = next
 
-                current_man = M.index(next)
-                rotation_subgraph.remove_edge(edge[0], edge[1])
+                current_man = M_inv[next]
 
+        rotation, cycle_starts = self.get_canonical_rotation(cycles)
         return rotation, new_M, cycle_starts
 
-    def remove_dominated_nonblocking_edges(self, M, E_prime):
+    def remove_dominated_nonblocking_edges(self, M, M_inv, E_prime):
         """Checks M and removes all edges from E' that are dominated by edges in M and are safe to remove.
 
         Parameters
         ----------
         M : list
             The current matching.
-        E_prime : list
-            List of edges in E', the edges not yet added to the graph.
+        M_inv : list
+            Inverse of the current matching. Index is the woman, value the man she's paired with.
+        E_prime : CandidateEdges
+            Edges in E', the edges not yet added to the graph.
 
         Returns
         -------
         none
         """
         for man, woman in enumerate(M):
-            # rank of man's current partner
-            current_partner = util.find_in_list_of_lists(woman, self.male_prefs[man])
-            for woman2 in range(len(self.male_prefs)):
-                # remove all pairs where m prefers woman2 to current partner
-                if util.find_in_list_of_lists(woman2, self.male_prefs[man]) <= current_partner:
-                    if ('m' + str(man), 'w' + str(woman2)) in E_prime:
-                        E_prime.remove(('m' + str(man), 'w' + str(woman2)))
-
-            # rank of woman's current partner
-            current_partner = util.find_in_list_of_lists(man, self.female_prefs[woman])
-            for man2 in range(len(self.female_prefs)):
-
-                # remove all pairs where w strictly prefers her current partner to man2
-                if util.find_in_list_of_lists(man2, self.female_prefs[woman]) > current_partner:
-                    if ('m' + str(man2), 'w' + str(woman)) in E_prime:
-                        E_prime.remove(('m' + str(man2), 'w' + str(woman)))
-
-    def delete_multiple_engagement_edges(self, E_prime, Gc, Ec, Gd, edge_ranks):
+            # remove all pairs where m weakly prefers the woman to current partner
+            if woman != -1:
+                E_prime.drop_man_at_or_above(man, E_prime.man_ranks[man][woman])
+        for woman, man in enumerate(M_inv):
+            # remove all pairs where w strictly prefers her current partner to the man
+            if man != -1:
+                E_prime.drop_woman_below(woman, E_prime.woman_ranks[woman][man])
+
+    def delete_multiple_engagement_edges(self, E_prime, Gc, Ec, Gd):
         """Deletes edges from E_prime and Ec that are involved in multiple engagements.
 
         Parameters
         ----------
-        E_prime : list
-            List of edges in E', the edges not yet added to the graph.
-        Gc : Digraph
+        E_prime : CandidateEdges
+            Edges in E', the edges not yet added to the graph.
+        Gc : CompactDigraph
             The digraph of candidate edges.
-        Ec : list
-            The edges that form Gc.
-        Gd : Digraph
+        Ec : dict
+            The edges that form Gc, as keys.
+        Gd : CondensedDigraph
             The digraph of current relevant edges.
-        edge_ranks: dict
-            Keys are edges, values are tuple. First value in tuple is man's ranking of the edge, second woman's.
         Returns
         -------
         None
         """
-        multiple_engaged_women = []
+        man_ranks = self.man_GSlist_rank.tolist()
+        woman_ranks = self.woman_GSlist_rank.tolist()
+        multiple_engaged_women = set()
         lowest_rank_in_edges_female = {}  # dict with woman as the key, [rank of lowest rank edge, count of that rank] seen as value.
-        for woman in range(len(self.female_prefs)):
-            lowest_rank_in_edges_female[woman] = []
-        for edge in E_prime + Ec:
-            woman = int(edge[1][1:])
-            if len(lowest_rank_in_edges_female[woman]) == 0 or lowest_rank_in_edges_female[woman][1] > edge_ranks[edge][
-                1]:  # if this edge is of lower rank for the woman, make this her new lowest rank edge
-                lowest_rank_in_edges_female[woman] = [edge_ranks[edge][1], 1]
-            elif lowest_rank_in_edges_female[woman][0] == edge_ranks[edge][
-                1]:  # if this edge is tied with the lowest, increment count
+        for edge in chain(E_prime, Ec):
+            man, woman = edge
+            if woman not in lowest_rank_in_edges_female or lowest_rank_in_edges_female[woman][1] > woman_ranks[woman][man]:  # if this edge is of lower rank for the woman, make this her new lowest rank edge
+                lowest_rank_in_edges_female[woman] = [woman_ranks[woman][man], 1]
+            elif lowest_rank_in_edges_female[woman][0] == woman_ranks[woman][man]:  # if this edge is tied with the lowest, increment count
                 lowest_rank_in_edges_female[woman][1] = lowest_rank_in_edges_female[woman][1] + 1
 
         for woman in lowest_rank_in_edges_female:
-            if  lowest_rank_in_edges_female[woman]!= [] and lowest_rank_in_edges_female[woman][1] > 1:
-                multiple_engaged_women.append(woman)
+            if lowest_rank_in_edges_female[woman][1] > 1:
+                multiple_engaged_women.add(woman)
         if len(multiple_engaged_women) > 1:
-            outdeg_zero_men = []
+            outdeg_zero_men = set()
             for man in range(len(self.male_prefs)):
-                component = \
-                [c for c in list(nx.strongly_connected_components(Gd.digraph)) if 'm' + str(man) in c][
-                    0]  # component containing m TODO: Is Gd the correct graph?
-                if util.get_outdegree_of_component(Gd, component) == 0:
-                    outdeg_zero_men.append(man)
+                if Gd.inSinkComponent(man):  # component containing m TODO: Is Gd the correct graph?
+                    outdeg_zero_men.add(man)
 
             lowest_ranked_edges_male = {}  # dict containing [[lowest ranked edges for man], rank of those edges]
-            for man in range(len(self.male_prefs)):
-                lowest_ranked_edges_male[man] = []
-            # get lowest ranked edges for outdeg_zero_men
-            for edge in E_prime + Ec:
-                man = int(edge[0][1:])
+            # get lowest ranked edges for outdeg_zero_men, E' gives each man's best edges directly
+            for man in outdeg_zero_men:
+                edges = E_prime.best(man)
+                if len(edges) > 0:
+                    lowest_ranked_edges_male[man] = [edges, man_ranks[man][edges[0][1]]]
+            for edge in Ec:
+                man, woman = edge
                 if man in outdeg_zero_men:
-                    if len(lowest_ranked_edges_male[man]) == 0 or lowest_ranked_edges_male[man][1] > edge_ranks[edge][
-                        0]:
-                        lowest_ranked_edges_male[man] = [[edge], edge_ranks[edge][0]]
-                    elif lowest_ranked_edges_male[man][1] == edge_ranks[edge][0]:
+                    if man not in lowest_ranked_edges_male or lowest_ranked_edges_male[man][1] > man_ranks[man][woman]:
+                        lowest_ranked_edges_male[man] = [[edge], man_ranks[man][woman]]
+                    elif lowest_ranked_edges_male[man][1] == man_ranks[man][woman]:
                         lowest_ranked_edges_male[man][0].append(edge)
 
             toremove = []
             for man in lowest_ranked_edges_male:
-                if lowest_ranked_edges_male[man] == []:
-                    continue
                 edges = lowest_ranked_edges_male[man][0]
                 for edge in edges:
-                    if int(edge[1][1:]) in multiple_engaged_women:
+                    if edge[1] in multiple_engaged_women:
                         toremove.append(edge)
 
             for edge in toremove:
                 if edge in Ec:
-                    Ec.remove(edge)
-                    Gc.digraph.remove_edge(edge[0], edge[1])
+                    del Ec[edge]
+                    Gc.removeDirectedEdge(edge[0], Gc.woman(edge[1]))
                 else:
                     E_prime.remove(edge)
 
@@ -1001,22 +2761,23 @@ class SuperStableMatchingInstance:
     #             lowest_rank_in_edges[woman][1] = lowest_rank_in_edges[woman][1] + 1
 
 
-    def initialize_digraph2(self):
+    def initialize_digraph2(self, condensed=False):
         """Initializes a digraph with a node for every matched man and woman.
 
         Parameters
         ----------
-        None
+        condensed : bool
+            If True, the digraph keeps track of its strongly connected components (used for Gd).
 
         Returns
         -------
-        Digraph
+        CompactDigraph
             Digraph with no edges and a node for every matched man and woman.
         """
-        g = Digraph()
+        g = CondensedDigraph(self.num_men) if condensed else CompactDigraph(self.num_men)
         for i in range(len(self.man_optimal_SM)):
             if self.man_optimal_SM[i] != -1:
-                g.addNodes(['m' + str(i), 'w' + str(i)])
+                g.addNodes([i, g.woman(i)])
         return g
 
     def add_directed_edges(self, digraph, edges, male_to_female):
@@ -1040,15 +2801,13 @@ class SuperStableMatchingInstance:
         for edge in edges:
             if male_to_female:
                 digraph_edges.append(['m' + str(edge[0]), 'w' + str(edge[1])])
-                edge_data.append({'male_rank': util.find_in_list_of_lists(edge[1], self.male_prefs[edge[0]]),
-                                  'female_rank': util.find_in_list_of_lists(edge[0], self.female_prefs[
-                                      edge[1]])})  # include the respective rankings in the edge data
+                edge_data.append({'male_rank': int(self.man_rank[edge[0], edge[1]]),
+                                  'female_rank': int(self.woman_rank[edge[1], edge[0]])})  # include the respective rankings in the edge data
 
             else:
                 digraph_edges.append(['w' + str(edge[0]), 'm' + str(edge[1])])
-                edge_data.append({'male_rank': util.find_in_list_of_lists(edge[0], self.male_prefs[edge[1]]),
-                                  'female_rank': util.find_in_list_of_lists(edge[1], self.female_prefs[
-                                      edge[0]])})  # include the respective rankings in the edge data
+                edge_data.append({'male_rank': int(self.man_rank[edge[1], edge[0]]),
+                                  'female_rank': int(self.woman_rank[edge[0], edge[1]])})  # include the respective rankings in the edge data
         for i in range(len(digraph_edges)):
             digraph.addDirectedEdge(digraph_edges[i][0], digraph_edges[i][1], **edge_data[i])
 
@@ -1083,7 +2842,7 @@ class SuperStableMatchingInstance:
 
         for i in range(len(rotations)):
             for pair in rotations[i]:
-                rank = util.find_in_list_of_lists(pair[1], self.male_prefs_GSlist[pair[0]])
+                rank = self.man_GSlist_rank[pair[0], pair[1]]
                 index = self.male_prefs_GSlist[pair[0]][rank].index(pair[1])
                 type_1_labels[pair[0]][rank][index] = i  # give type 1 label in the spot of the woman on the man's list
 
@@ -1093,18 +2852,18 @@ class SuperStableMatchingInstance:
                 old_man = rotations[i][j][0]
                 new_man = rotations[i][(j - 1) % len(rotations[i])][
                     0]  # woman's new man is the one in the previous pair in the rotation
-                old_man_rank = util.find_in_list_of_lists(old_man, self.female_prefs_GSlist[woman])
+                old_man_rank = self.woman_GSlist_rank[woman, old_man]
                 #    old_man_index = self.female_prefs_GSlist[woman][old_man_rank].index(old_man)
-                new_man_rank = util.find_in_list_of_lists(new_man, self.female_prefs_GSlist[woman])
+                new_man_rank = self.woman_GSlist_rank[woman, new_man]
                 #                new_man_index = self.female_prefs_GSlist[woman][new_man_rank].index(new_man)
                 skipped_men = self.female_prefs_GSlist[woman][new_man_rank
                                                               + 1: old_man_rank]  # all the men in between the new man and the old in the woman's list
                 for rank in skipped_men:
                     for man in rank:
                         # apply type 2 label in the spot of the woman in the skipped man's list
-                        rank = util.find_in_list_of_lists(woman, self.male_prefs_GSlist[man])
+                        rank = self.man_GSlist_rank[man, woman]
                         index = self.male_prefs_GSlist[man][rank].index(woman)
-                        type_2_labels[man][util.find_in_list_of_lists(woman, self.male_prefs_GSlist[man])][index] = i
+                        type_2_labels[man][rank][index] = i
 
         # print(type_1_labels)
         # print(type_2_labels)
@@ -18,7 +18,7 @@ session = boto3.Session(
 )
 core_count = os.cpu_count()
 
-def get_results(n, k, count, indiff, pref_file, done, path):
+def get_results(n, k, count, indiff, pref_file, done, path, screen=False):
     # n, k, count, _ = pref_file.split('_')
     new_file = f"{n}_{k}_{count}_ind:{indiff}"
 
@@ -39,6 +39,10 @@ def get_results(n, k, count, indiff, pref_file, done, path):
         done = False
         j = (i+1)%len(instances)
         while(not done):
+            # skip partners with no super-stable matching before running the full algorithm
+            if screen and not SuperStableMatchingInstance.has_super_stable_matching(instances[i], instances[j]):
+                j = (j + 1) % len(instances)
+                continue
             try:
                 results.append(SuperStableMatchingInstance.run_example(instances[i], instances[j]))
                 done = True
@@ -51,7 +55,7 @@ def get_results(n, k, count, indiff, pref_file, done, path):
     print(time.time() - start)
     s3.Bucket(bucket_name).put_object(Key=new_path, Body=encoded_results)
 
-def get_results_mixed(prefs1, prefs2, done, path):
+def get_results_mixed(prefs1, prefs2, done, path, screen=False):
     n1, k1, count1, indiff1, pref_file1 = prefs1
     n2, k2, count2, indiff2, pref_file2 = prefs1
     assert count1 == count2, "count mismatch" + prefs1 + prefs2
@@ -77,6 +81,10 @@ def get_results_mixed(prefs1, prefs2, done, path):
         done = False
         j = i
         while (not done):
+            # skip partners with no super-stable matching before running the full algorithm
+            if screen and not SuperStableMatchingInstance.has_super_stable_matching(instances1[i], instances2[j]):
+                j = (j + 1) % len(instances1)
+                continue
             try:
                 results.append(SuperStableMatchingInstance.run_example(instances1[i], instances2[j]))
                 done = True
@@ -88,7 +96,7 @@ def get_results_mixed(prefs1, prefs2, done, path):
     encoded_results = str(results).encode("utf-8")
     print(time.time() - start)
     s3.Bucket(bucket_name).put_object(Key=new_path, Body=encoded_results)
-def get_results_against_uniform(n, tiers, count, indiff, pref_file, done, path):
+def get_results_against_uniform(n, tiers, count, indiff, pref_file, done, path, screen=False):
 
     new_file = f"{n}_{tiers}_{count}_ind:{indiff}x_uni_ind:1"
     uniform = f'{path}/prefs/tiered/100_[100]_100'
@@ -109,6 +117,10 @@ def get_results_against_uniform(n, tiers, count, indiff, pref_file, done, path):
         done = False
         j = i
         while(not done):
+            # skip partners with no super-stable matching before running the full algorithm
+            if screen and not SuperStableMatchingInstance.has_super_stable_matching(instances[i], instances_uniform[j]):
+                j = (j + 1) % len(instances)
+                continue
             try:
                 a = SuperStableMatchingInstance.run_example(instances[i], instances_uniform[j])
                 if a == ([], [], []):
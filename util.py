@@ -1,7 +1,12 @@
 # A few utility functions.
 
+import time
+import numpy as np
+import networkx as nx
 from GraphVisualization import Digraph
 
+# rank given to an agent that is not on a preference list
+UNACCEPTABLE = -1
 
 
 def find_in_list_of_lists(element, l):
@@ -43,6 +48,98 @@ def remove_from_list_of_lists(element, list):
         if element in list[i]:
             list[i].remove(element)
 
+def get_list_size(prefs, size=0):
+    """Returns the number of agents that can appear on the preference lists. This is the larger of size and one more
+    than the largest agent found on any list.
+
+       Parameters
+       ----------
+       prefs: list
+           List of individual preference lists. Each individual list is a list of lists, to account for indifference.
+       size: int
+           Minimum size to return, usually the number of agents on the other side.
+
+       Returns
+       -------
+       int:
+            Number of agents that can appear on the lists.
+       """
+    for l in prefs:
+        for tier in l:
+            if len(tier) > 0:
+                size = max(size, max(tier) + 1)
+    return size
+
+def get_rank_matrix(prefs, size):
+    """ Builds the rank matrix of preference lists, so that rank lookups are O(1) instead of a scan of the list.
+    Entry [i, j] is the index of the tier agent j is in on agent i's list, or UNACCEPTABLE if j is not on the list.
+    The matrix has one extra trailing column that is always UNACCEPTABLE, so that looking up the partner -1 (unmatched)
+    gives UNACCEPTABLE just like find_in_list_of_lists does.
+
+
+       Parameters
+       ----------
+       prefs: list
+           List of individual preference lists. Each individual list is a list of lists, to account for indifference.
+       size: int
+           Number of agents that can appear on the lists, see get_list_size.
+
+       Returns
+       -------
+       np.ndarray:
+            Integer array of shape (len(prefs), size + 1).
+       """
+    ranks = np.full((len(prefs), size + 1), UNACCEPTABLE, dtype=np.int64)
+    for i in range(len(prefs)):
+        for rank in range(len(prefs[i])):
+            ranks[i, prefs[i][rank]] = rank
+    return ranks
+
+def get_prefs_from_rank_matrix(ranks):
+    """ Converts a rank matrix back to preference lists. Agents are ordered by rank, agents with equal rank form a tie
+    and any negative rank is treated as unacceptable. Ranks don't need to be consecutive.
+
+
+       Parameters
+       ----------
+       ranks: np.ndarray
+           2d array where entry [i, j] is agent i's rank of agent j.
+
+       Returns
+       -------
+       list:
+            List of individual preference lists. Each individual list is a list of lists, to account for indifference.
+       """
+    ranks = np.asarray(ranks)
+    prefs = []
+    for row in ranks:
+        tiers = {}
+        for agent in np.flatnonzero(row >= 0):
+            tiers.setdefault(int(row[agent]), []).append(int(agent))
+        prefs.append([tiers[rank] for rank in sorted(tiers)])
+    return prefs
+
+def get_bits(bits):
+    """ Lists the bits set in a bitset.
+
+
+       Parameters
+       ----------
+       bits: int
+           Bitset, bit i is set if i is in the set.
+
+       Returns
+       -------
+       list:
+            The indices of the set bits, in increasing order.
+       """
+    indices = []
+    while bits:
+        low = bits & -bits
+        indices.append(low.bit_length() - 1)
+        bits ^= low
+    return indices
+
 # Returns the outdegree of a connected component as defined by nodes in a digraph.
 def get_outdegree_of_component(digraph, component_nodes):
     """ Gets the outdegree of a component in a digraph.
@@ -67,3 +164,461 @@ def get_outdegree_of_component(digraph, component_nodes):
             if edge[1] not in component_nodes:
                 out_count = out_count + 1
     return out_count
+
+def count_ideals(poset):
+    """ Counts the ideals (closed sets) of a poset, which is the number of its antichains, without listing them.
+    The count is the product of the counts of the weakly connected components. Each component is counted by dynamic
+    programming along a topological order of its transitive reduction, which is a path decomposition of the poset: the
+    state is which of the elements still having unprocessed successors are in the ideal, and each state's count is
+    kept so ideals agreeing on it are counted together.
+
+
+       Parameters
+       ----------
+       poset: nx.DiGraph
+           Directed acyclic graph whose edges go from an element to the elements above it.
+
+       Returns
+       -------
+       int:
+            Number of ideals, including the empty one, as a Python int.
+       """
+    count = 1
+    for component in nx.weakly_connected_components(poset):
+        count *= count_ideals_of_component(nx.transitive_reduction(poset.subgraph(component)))
+    return count
+
+def count_ideals_of_component(poset):
+    """ Counts the ideals of a poset by dynamic programming over the steps given by get_ideal_dp_steps. Meant to be
+    called by count_ideals, with a transitively reduced poset.
+
+
+       Parameters
+       ----------
+       poset: nx.DiGraph
+           Transitively reduced directed acyclic graph.
+
+       Returns
+       -------
+       int:
+            Number of ideals, including the empty one.
+       """
+    counts = {frozenset(): 1}  # included elements among the active ones as key, number of partial ideals as value
+    for node, preds, retired, active in get_ideal_dp_steps(poset):
+        new_counts = {}
+        for state, count in counts.items():
+            excluded = state - retired
+            new_counts[excluded] = new_counts.get(excluded, 0) + count
+            if preds <= state:  # node can be in the ideal only if everything below it is
+                included = excluded | {node} if active else excluded
+                new_counts[included] = new_counts.get(included, 0) + count
+        counts = new_counts
+    return sum(counts.values())
+
+def get_ideal_dp_steps(poset):
+    """ Generates the steps of the dynamic programs over the ideals of a poset. Elements are taken in a topological
+    order, chosen greedily to keep the fewest active elements (elements with unprocessed successors), since the number
+    of states grows with them. The state after a step is which active elements are in the ideal.
+
+
+       Parameters
+       ----------
+       poset: nx.DiGraph
+           Directed acyclic graph, preferably transitively reduced.
+
+       Returns
+       -------
+       generator:
+            Generator of (node, preds, retired, active) tuples: the element decided at this step, the set of its
+            predecessors, the set of elements that stop being active, and whether the element itself becomes active.
+       """
+    unprocessed_preds = {node: poset.in_degree(node) for node in poset}
+    unprocessed_succs = {node: poset.out_degree(node) for node in poset}
+    available = [node for node in poset if unprocessed_preds[node] == 0]
+    while available:
+        # pick the element that retires the most active elements
+        node = max(available, key=lambda n: sum(1 for p in poset.predecessors(n) if unprocessed_succs[p] == 1)
+                                            - (poset.out_degree(n) > 0))
+        available.remove(node)
+        preds = set(poset.predecessors(node))
+        retired = set()
+        for pred in preds:
+            unprocessed_succs[pred] -= 1
+            if unprocessed_succs[pred] == 0:
+                retired.add(pred)
+        for succ in poset.successors(node):
+            unprocessed_preds[succ] -= 1
+            if unprocessed_preds[succ] == 0:
+                available.append(succ)
+        yield node, preds, retired, poset.out_degree(node) > 0
+
+def sample_ideals_exactly(poset, count, rnd, max_states=100000):
+    """ Draws ideals of a poset uniformly at random. The dynamic program of count_ideals is run keeping every step's
+    counts and transitions, then each sample picks a final state in proportion to its count and walks the steps
+    backwards, picking the previous state in proportion to its count.
+
+
+       Parameters
+       ----------
+       poset: nx.DiGraph
+           Directed acyclic graph whose edges go from an element to the elements above it.
+       count: int
+           Number of ideals to draw.
+       rnd: random.Random
+           Random number generator.
+       max_states: int
+           Give up if a step has more states than this.
+
+       Returns
+       -------
+       list:
+            The ideals, as sets of elements. None if there were too many states.
+       """
+    poset = nx.transitive_reduction(poset)
+    steps = []  # for each step, the node and a dict with the new states as keys, list of (old state, included) as value
+    all_counts = [{frozenset(): 1}]
+    for node, preds, retired, active in get_ideal_dp_steps(poset):
+        transitions = {}
+        new_counts = {}
+        for state, state_count in all_counts[-1].items():
+            excluded = state - retired
+            new_counts[excluded] = new_counts.get(excluded, 0) + state_count
+            transitions.setdefault(excluded, []).append((state, False))
+            if preds <= state:
+                included = excluded | {node} if active else excluded
+                new_counts[included] = new_counts.get(included, 0) + state_count
+                transitions.setdefault(included, []).append((state, True))
+        if len(new_counts) > max_states:
+            return None
+        steps.append((node, transitions))
+        all_counts.append(new_counts)
+
+    ideals = []
+    for _ in range(count):
+        state = pick_weighted(all_counts[-1], rnd)
+        ideal = set()
+        for i in range(len(steps) - 1, -1, -1):
+            node, transitions = steps[i]
+            options = transitions[state]
+            index = pick_weighted({j: all_counts[i][options[j][0]] for j in range(len(options))}, rnd)
+            state, included = options[index]
+            if included:
+                ideal.add(node)
+        ideals.append(ideal)
+    return ideals
+
+def pick_weighted(weights, rnd):
+    """ Picks a key of a dict with probability proportional to its value. Values can be arbitrarily large ints.
+
+
+       Parameters
+       ----------
+       weights: dict
+           Keys to pick from as keys, nonnegative int weights as values.
+       rnd: random.Random
+           Random number generator.
+
+       Returns
+       -------
+       object:
+            The key picked.
+       """
+    target = rnd.randrange(sum(weights.values()))
+    for key, weight in weights.items():
+        if target < weight:
+            return key
+        target -= weight
+
+def sample_ideals_by_chain(poset, count, rnd, steps):
+    """ Draws ideals of a poset approximately uniformly at random with a Markov chain. At each step a random element
+    is picked, and added to the ideal if everything below it is in it, or removed from the ideal if nothing above it
+    is in it, each with probability 1/2. The chain is symmetric, so its stationary distribution is uniform. It starts
+    from the empty ideal and runs steps steps before the first sample and between samples.
+
+
+       Parameters
+       ----------
+       poset: nx.DiGraph
+           Directed acyclic graph whose edges go from an element to the elements above it.
+       count: int
+           Number of ideals to draw.
+       rnd: random.Random
+           Random number generator.
+       steps: int
+           Number of steps before each sample.
+
+       Returns
+       -------
+       list:
+            The ideals, as sets of elements.
+       """
+    poset = nx.transitive_reduction(poset)
+    nodes = list(poset)
+    preds = {node: list(poset.predecessors(node)) for node in nodes}
+    succs = {node: list(poset.successors(node)) for node in nodes}
+    ideal = set()
+    ideals = []
+    for _ in range(count):
+        if len(nodes) > 0:
+            for _ in range(steps):
+                node = nodes[rnd.randrange(len(nodes))]
+                if rnd.random() < 0.5:
+                    if node not in ideal and all(pred in ideal for pred in preds[node]):
+                        ideal.add(node)
+                elif node in ideal and not any(succ in ideal for succ in succs[node]):
+                    ideal.remove(node)
+        ideals.append(set(ideal))
+    return ideals
+
+def get_poset_height(poset):
+    """ Gets the height of a poset, the number of elements in its longest chain, with dynamic programming over a
+    topological order.
+
+
+       Parameters
+       ----------
+       poset: nx.DiGraph
+           Directed acyclic graph whose edges go from an element to the elements above it.
+
+       Returns
+       -------
+       int:
+            The height of the poset. 0 if it is empty.
+       """
+    longest = {}  # element as key, number of elements in the longest chain ending at it as value
+    for node in nx.topological_sort(poset):
+        longest[node] = 1 + max((longest[pred] for pred in poset.predecessors(node)), default=0)
+    return max(longest.values(), default=0)
+
+def get_poset_width(descendants):
+    """ Gets the width of a poset, the size of its largest antichain. By Dilworth's theorem it is the number of
+    elements minus the size of a maximum matching in the bipartite graph with an edge from a to b whenever a is below
+    b, which is found with Hopcroft-Karp.
+
+
+       Parameters
+       ----------
+       descendants: list
+           descendants[a] is a bitset with bit b set if a is below b, e.g. the rotation_descendants index.
+
+       Returns
+       -------
+       int:
+            The width of the poset.
+       """
+    above = [get_bits(bits) for bits in descendants]
+    return len(above) - get_maximum_matching_size(above, len(above))
+
+def get_maximum_matching_size(adjacency, num_right):
+    """ Gets the size of a maximum matching in a bipartite graph with the Hopcroft-Karp algorithm.
+
+
+       Parameters
+       ----------
+       adjacency: list
+           adjacency[u] is the list of right vertices left vertex u is adjacent to.
+       num_right: int
+           Number of right vertices.
+
+       Returns
+       -------
+       int:
+            Size of a maximum matching.
+       """
+    left_match = [-1] * len(adjacency)
+    right_match = [-1] * num_right
+    size = 0
+    while True:
+        # breadth first search from the free left vertices, layering the graph by alternating path length
+        distance = [-1] * len(adjacency)
+        queue = [u for u in range(len(adjacency)) if left_match[u] == -1]
+        for u in queue:
+            distance[u] = 0
+        found = False
+        for u in queue:
+            for v in adjacency[u]:
+                w = right_match[v]
+                if w == -1:
+                    found = True
+                elif distance[w] == -1:
+                    distance[w] = distance[u] + 1
+                    queue.append(w)
+        if not found:
+            return size
+
+        # depth first search for vertex disjoint shortest augmenting paths
+        next_edge = [0] * len(adjacency)
+        for root in range(len(adjacency)):
+            if left_match[root] != -1:
+                continue
+            path = [root]
+            while path:
+                u = path[-1]
+                if next_edge[u] == len(adjacency[u]):
+                    distance[u] = -1  # dead end
+                    path.pop()
+                    continue
+                v = adjacency[u][next_edge[u]]
+                next_edge[u] += 1
+                w = right_match[v]
+                if w == -1:
+                    # augment along the path
+                    for u in reversed(path):
+                        left_match[u], v = v, left_match[u]
+                        right_match[left_match[u]] = u
+                    size += 1
+                    break
+                if distance[w] == distance[u] + 1:
+                    path.append(w)
+
+def get_pathwidth(edges, time_budget=10):
+    """ Gets the pathwidth of an undirected graph, computed as its vertex separation number: the smallest, over all
+    orderings of the vertices, of the largest number of vertices in a prefix of the ordering with a neighbor outside
+    it. Each connected component is solved by branch and bound over prefixes, with the prefixes already reached at a
+    lower cost memoised. If the time budget runs out, the result is a greedy upper bound, along with the degeneracy
+    of the graph as lower bound.
+
+
+       Parameters
+       ----------
+       edges: list
+           Edges of the graph, as pairs of vertices.
+       time_budget: float
+           Seconds the branch and bound may run, shared by all components.
+
+       Returns
+       -------
+       int:
+            Pathwidth, or an upper bound if the search didn't finish.
+       int:
+            Lower bound on the pathwidth. Equal to the pathwidth if the search finished.
+       """
+    graph = nx.Graph()
+    graph.add_edges_from(edges)
+    deadline = time.monotonic() + time_budget
+    upper = 0
+    lower = 0
+    for component in nx.connected_components(graph):
+        component_upper, component_lower = get_component_pathwidth(graph.subgraph(component), deadline)
+        upper = max(upper, component_upper)
+        lower = max(lower, component_lower)
+    return upper, lower
+
+def get_component_pathwidth(graph, deadline):
+    """ Branch and bound for the vertex separation number of a connected graph, see get_pathwidth.
+
+
+       Parameters
+       ----------
+       graph: nx.Graph
+           Connected undirected graph.
+       deadline: float
+           time.monotonic() value at which to give up.
+
+       Returns
+       -------
+       int:
+            Pathwidth, or an upper bound if the search didn't finish.
+       int:
+            Lower bound on the pathwidth.
+       """
+    nodes = list(graph)
+    index = {node: i for i, node in enumerate(nodes)}
+    neighbors = [[index[neighbor] for neighbor in graph.neighbors(node)] for node in nodes]
+    neighbor_bits = [sum(1 << neighbor for neighbor in l) for l in neighbors]
+    everything = (1 << len(nodes)) - 1
+
+    def add(prefix, boundary, v):
+        # boundary size after adding v to the prefix
+        new_prefix = prefix | (1 << v)
+        for u in neighbors[v]:
+            if prefix >> u & 1 and neighbor_bits[u] & ~new_prefix == 0:
+                boundary -= 1
+        if neighbor_bits[v] & ~new_prefix:
+            boundary += 1
+        return new_prefix, boundary
+
+    # greedy upper bound: always add the vertex that gives the smallest boundary
+    prefix, boundary, best = 0, 0, 0
+    while prefix != everything:
+        prefix, boundary = min((add(prefix, boundary, v) for v in range(len(nodes)) if not prefix >> v & 1),
+                               key=lambda step: step[1])
+        best = max(best, boundary)
+
+    lower = get_degeneracy(graph)
+    if best == lower:
+        return best, lower
+
+    # branch and bound, the prefixes are memoised with the lowest cost they were reached at
+    reached = {}
+    stack = [(0, 0, 0)]  # prefix, its boundary size, largest boundary size on the way
+    while stack:
+        if time.monotonic() > deadline:
+            return best, lower
+        prefix, boundary, cost = stack.pop()
+        if cost >= best:
+            continue
+        if prefix == everything:
+            best = cost
+            if best == lower:
+                break
+            continue
+        steps = []
+        for v in range(len(nodes)):
+            if not prefix >> v & 1:
+                new_prefix, new_boundary = add(prefix, boundary, v)
+                new_cost = max(cost, new_boundary)
+                if new_cost < best and reached.get(new_prefix, best) > new_cost:
+                    reached[new_prefix] = new_cost
+                    steps.append((new_prefix, new_boundary, new_cost))
+        steps.sort(key=lambda step: step[1], reverse=True)  # smallest boundary is popped first
+        stack.extend(steps)
+    return best, best
+
+def get_degeneracy(graph):
+    """ Gets the degeneracy of an undirected graph, the largest minimum degree of its subgraphs, which is a lower bound
+    on its treewidth and so on its pathwidth.
+
+
+       Parameters
+       ----------
+       graph: nx.Graph
+           Undirected graph.
+
+       Returns
+       -------
+       int:
+            The degeneracy.
+       """
+    return max(nx.core_number(graph).values(), default=0)
+
+def get_max_weight_closure(poset, weights):
+    """ Finds a set of elements of a poset, closed under taking predecessors, with the largest total weight. Solved as
+    a single minimum cut: the source has an edge to every positive element and every negative element an edge to the
+    sink, with the weight as capacity, and every element has an edge of infinite capacity to each of its predecessors.
+    The elements on the source side of a minimum cut form a maximum weight closure.
+
+
+       Parameters
+       ----------
+       poset: nx.DiGraph
+           Directed acyclic graph whose edges go from an element to the elements above it.
+       weights: dict
+           Element as key, weight as value.
+
+       Returns
+       -------
+       set:
+            The elements in the closure.
+       """
+    flow_graph = nx.DiGraph()
+    flow_graph.add_nodes_from(['source', 'sink'])
+    for node in poset:
+        if weights[node] > 0:
+            flow_graph.add_edge('source', node, capacity=weights[node])
+        elif weights[node] < 0:
+            flow_graph.add_edge(node, 'sink', capacity=-weights[node])
+        for pred in poset.predecessors(node):
+            flow_graph.add_edge(node, pred)  # no capacity attribute means infinite capacity
+    _, (source_side, _) = nx.minimum_cut(flow_graph, 'source', 'sink')
+    return set(node for node in source_side if node != 'source')